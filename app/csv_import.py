@@ -0,0 +1,274 @@
+import os
+import asyncio
+import numpy as np
+import pandas as pd
+from typing import List, Tuple, Dict, Any, Optional, BinaryIO
+
+from app.database import create_user, create_users_batch
+
+# Columns accepted in the users CSV
+REQUIRED_COLUMNS = ['first_name', 'phone']
+OPTIONAL_COLUMNS = ['last_name', 'age', 'email', 'street_address', 'city', 'state', 'postal_code', 'country']
+
+# Number of users sent to Supabase per bulk insert
+CSV_IMPORT_CHUNK_SIZE = int(os.getenv("CSV_IMPORT_CHUNK_SIZE", "500"))
+
+# Rows parsed and validated at a time by the streaming import
+CSV_STREAM_CHUNK_ROWS = int(os.getenv("CSV_STREAM_CHUNK_ROWS", "5000"))
+
+# Streaming imports keep only this many error/warning messages in memory
+CSV_STREAM_MAX_MESSAGES = int(os.getenv("CSV_STREAM_MAX_MESSAGES", "1000"))
+
+# Read every cell as text so phones keep leading zeros and never become floats
+CSV_READ_OPTIONS = {"dtype": str}
+
+
+class MissingColumnsError(Exception):
+    """Raised by the streaming import when the CSV lacks required columns"""
+
+
+def missing_required_columns(df: pd.DataFrame) -> List[str]:
+    """Return the required columns that are not present in the CSV"""
+    return [col for col in REQUIRED_COLUMNS if col not in df.columns]
+
+
+def _clean(series: pd.Series) -> pd.Series:
+    """Strip a column as text, turning blank cells into <NA>"""
+    cleaned = series.astype("string").str.strip()
+    return cleaned.mask(cleaned == "")
+
+
+def validate_users_dataframe(df: pd.DataFrame) -> Tuple[List[dict], List[str], List[int]]:
+    """
+    Validate a users DataFrame column by column
+
+    Every check is computed as a boolean mask over the whole column; Python only
+    loops over the rows that actually have errors (to build the messages) and
+    over the valid rows (to build the insert payloads).
+
+    Args:
+        df: DataFrame read from the uploaded CSV
+
+    Returns:
+        Tuple of (valid user dicts ready for insertion, error messages, row number
+        of each valid user). Row numbers come from the DataFrame index, so chunks
+        keep the numbering of the whole file.
+    """
+    columns = {col: _clean(df[col]) for col in REQUIRED_COLUMNS + OPTIONAL_COLUMNS if col in df.columns}
+
+    missing_required = (columns['first_name'].isna() | columns['phone'].isna()).to_numpy()
+
+    # (mask, message) pairs in the order errors are reported for a row
+    checks = [(missing_required, "first_name and phone cannot be empty")]
+
+    if 'age' in columns:
+        age_present = columns['age'].notna().to_numpy()
+        age_numbers = pd.to_numeric(columns['age'], errors='coerce').astype("Float64")
+        age_invalid = age_present & (age_numbers.isna() | (age_numbers % 1 != 0)).fillna(True).to_numpy()
+        age_not_positive = age_present & ~age_invalid & (age_numbers <= 0).fillna(False).to_numpy()
+        checks.append((age_not_positive & ~missing_required, "Age must be greater than 0"))
+        checks.append((age_invalid & ~missing_required, "Age must be a valid number"))
+        columns['age'] = age_numbers.mask(~age_present | age_invalid).astype("Int64")
+
+    if 'email' in columns:
+        email_present = columns['email'].notna().to_numpy()
+        email_invalid = email_present & ~columns['email'].str.contains('@', regex=False).fillna(False).to_numpy()
+        checks.append((email_invalid & ~missing_required, "Invalid email format"))
+
+    error_matrix = np.column_stack([mask for mask, _ in checks])
+    row_has_error = error_matrix.any(axis=1)
+
+    errors = []
+    for position in np.flatnonzero(row_has_error):
+        row_number = df.index[position] + 1
+        for (_, message), failed in zip(checks, error_matrix[position]):
+            if failed:
+                errors.append(f"Row {row_number}: {message}")
+
+    # Build payloads from plain column lists instead of per-row pandas access
+    valid = ~row_has_error
+    names = list(columns)
+    values = []
+    for name in names:
+        column = columns[name][valid]
+        values.append(column.astype(object).where(column.notna(), None).tolist())
+    users_data = [
+        {name: value for name, value in zip(names, row) if value is not None}
+        for row in zip(*values)
+    ]
+    row_numbers = (df.index[valid] + 1).tolist()
+
+    return users_data, errors, row_numbers
+
+
+async def _insert_chunk_row_by_row(chunk: List[dict], row_numbers: List[int]) -> Tuple[int, List[str]]:
+    """Fallback for a chunk whose bulk insert failed: insert each user on its own"""
+    created_count = 0
+    warnings = []
+    for line, user_data in zip(row_numbers, chunk):
+        try:
+            created_user = await create_user(user_data)
+            if created_user:
+                created_count += len(created_user)
+        except Exception as e:
+            error_message = str(e)
+            if "já existe" in error_message:
+                warnings.append(f"Line {line}: {error_message}")
+            else:
+                warnings.append(f"Line {line}: Error creating user - {error_message}")
+    return created_count, warnings
+
+
+async def insert_users_chunk(chunk: List[dict], row_numbers: List[int]) -> Tuple[int, List[str]]:
+    """
+    Insert one chunk of users with a single bulk request
+
+    Phones that already exist (in the table or earlier in the chunk) are skipped by
+    PostgREST's ignore-duplicates upsert and reported as warnings. If the bulk request
+    fails for any other reason the chunk is retried row by row so that only the bad
+    rows are reported.
+
+    Args:
+        chunk: Validated user dicts
+        row_numbers: CSV row number of each user, used in the warnings
+
+    Returns:
+        Tuple of (number of users created, warning messages)
+    """
+    try:
+        # Only the inserted phones are needed to tell duplicates apart
+        created = await create_users_batch(
+            chunk, on_conflict="phone", resolution="ignore-duplicates", returning="phone"
+        )
+    except Exception as e:
+        print(f"Bulk insert failed for lines {row_numbers[0]}-{row_numbers[-1]}, retrying row by row: {e}")
+        return await _insert_chunk_row_by_row(chunk, row_numbers)
+
+    inserted_phones = {user['phone'] for user in created}
+    warnings = []
+    for line, user_data in zip(row_numbers, chunk):
+        phone = user_data['phone']
+        if phone in inserted_phones:
+            # Only the first occurrence of a phone can have been inserted
+            inserted_phones.discard(phone)
+        else:
+            warnings.append(f"Line {line}: Usuário com telefone {phone} já existe")
+
+    return len(created), warnings
+
+
+async def import_users(users_data: List[dict], chunk_size: int = CSV_IMPORT_CHUNK_SIZE,
+                       row_numbers: Optional[List[int]] = None) -> Dict[str, Any]:
+    """
+    Insert validated users in chunked bulk requests
+
+    row_numbers (from validate_users_dataframe) defaults to 1..len(users_data).
+
+    Returns:
+        Dict with imported_count and the list of warnings for rows that were not created
+    """
+    row_numbers = row_numbers or list(range(1, len(users_data) + 1))
+    imported_count = 0
+    warnings = []
+    for start in range(0, len(users_data), chunk_size):
+        created_count, chunk_warnings = await insert_users_chunk(
+            users_data[start:start + chunk_size], row_numbers[start:start + chunk_size]
+        )
+        imported_count += created_count
+        warnings.extend(chunk_warnings)
+
+    return {"imported_count": imported_count, "warnings": warnings}
+
+
+def _next_validated_chunk(reader) -> Optional[Tuple[int, List[dict], List[str], List[int]]]:
+    """Parse and validate the next CSV chunk (runs in a worker thread)"""
+    df = next(reader, None)
+    if df is None:
+        return None
+    missing_columns = missing_required_columns(df)
+    if missing_columns:
+        raise MissingColumnsError(f"Missing required columns: {missing_columns}")
+    users_data, errors, row_numbers = validate_users_dataframe(df)
+    return len(df), users_data, errors, row_numbers
+
+
+async def stream_import_users(file: BinaryIO, chunk_rows: int = CSV_STREAM_CHUNK_ROWS,
+                              insert_chunk_size: int = CSV_IMPORT_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Import a CSV of users without loading the whole file in memory
+
+    The uploaded file is read from its spool in chunks of chunk_rows rows. Parsing
+    and validation run in a worker thread so the event loop stays free, and the
+    next chunk is parsed while the current one is being inserted. Invalid rows are
+    skipped and reported instead of rejecting the whole file. A malformed line
+    (e.g. too many fields) stops the import there: chunks before it stay imported
+    and the summary reports the parse error.
+
+    Args:
+        file: Binary file object of the upload (UploadFile.file)
+        chunk_rows: Rows parsed and validated per chunk
+        insert_chunk_size: Users per bulk insert request
+
+    Returns:
+        Import summary with counts and (capped) error and warning messages
+    """
+    file.seek(0)
+    reader = await asyncio.to_thread(
+        pd.read_csv, file, chunksize=chunk_rows, encoding='utf-8', **CSV_READ_OPTIONS
+    )
+
+    total_rows = 0
+    invalid_rows = 0
+    imported_count = 0
+    failed_count = 0
+    errors = []
+    warnings = []
+    parse_error = None
+
+    try:
+        pending = asyncio.ensure_future(asyncio.to_thread(_next_validated_chunk, reader))
+        while True:
+            try:
+                chunk = await pending
+            except pd.errors.ParserError as e:
+                parse_error = f"CSV parsing error after row {total_rows}: {str(e).strip()}"
+                break
+            if chunk is None:
+                break
+            # Start parsing the next chunk while this one is inserted
+            pending = asyncio.ensure_future(asyncio.to_thread(_next_validated_chunk, reader))
+
+            row_count, users_data, chunk_errors, row_numbers = chunk
+            total_rows += row_count
+            invalid_rows += row_count - len(users_data)
+            errors.extend(chunk_errors[:max(CSV_STREAM_MAX_MESSAGES - len(errors), 0)])
+
+            for start in range(0, len(users_data), insert_chunk_size):
+                batch = users_data[start:start + insert_chunk_size]
+                created_count, batch_warnings = await insert_users_chunk(
+                    batch, row_numbers[start:start + insert_chunk_size]
+                )
+                imported_count += created_count
+                failed_count += len(batch_warnings)
+                warnings.extend(batch_warnings[:max(CSV_STREAM_MAX_MESSAGES - len(warnings), 0)])
+    finally:
+        reader.close()
+
+    result = {
+        "message": f"Import completed: {imported_count} contacts added",
+        "imported_count": imported_count,
+        "total_rows": total_rows,
+        "invalid_rows": invalid_rows
+    }
+
+    if parse_error:
+        result["message"] = f"Import stopped at a malformed line: {imported_count} contacts added"
+        result["parse_error"] = parse_error
+        errors.append(parse_error)
+    if errors:
+        result["errors"] = errors
+    if warnings:
+        result["warnings"] = warnings
+        result["failed_count"] = failed_count
+
+    return result
@@ -1,9 +1,14 @@
 import os
+import asyncio
+import base64
 import httpx
 import json
+from functools import partial
 from dotenv import load_dotenv
 from uuid import UUID
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Callable, Awaitable, AsyncIterator
+
+from app.cache import TTLCache
 
 # Load environment variables
 load_dotenv()
@@ -23,130 +28,483 @@ headers = {
     "Prefer": "return=representation"
 }
 
+# Connection pool settings for the shared Supabase HTTP client
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "100"))
+SUPABASE_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("SUPABASE_MAX_KEEPALIVE_CONNECTIONS", "20"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "5"))
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+SUPABASE_POOL_TIMEOUT = float(os.getenv("SUPABASE_POOL_TIMEOUT", "10"))
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() in ("1", "true", "yes")
+
+# In-process cache of form rows by id; create/update paths keep it current and
+# the ttl bounds staleness from writes made by other processes
+FORM_CACHE_SIZE = int(os.getenv("FORM_CACHE_SIZE", "1000"))
+FORM_CACHE_TTL = float(os.getenv("FORM_CACHE_TTL", "60"))
+_form_cache = TTLCache("forms", FORM_CACHE_SIZE, FORM_CACHE_TTL)
+
+# Shared client, created by the FastAPI lifespan (or lazily on first use)
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    """HTTP/2 in httpx needs the optional 'h2' package"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    """Create the pooled client used for every Supabase REST call"""
+    http2 = SUPABASE_HTTP2 and _http2_available()
+    if SUPABASE_HTTP2 and not http2:
+        print("Warning: SUPABASE_HTTP2 is enabled but the 'h2' package is not installed "
+              "(pip install 'httpx[http2]'); falling back to HTTP/1.1")
+    print(f"Creating Supabase HTTP client (http2={http2}, max_connections={SUPABASE_MAX_CONNECTIONS})")
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=SUPABASE_MAX_CONNECTIONS,
+            max_keepalive_connections=SUPABASE_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(
+            SUPABASE_TIMEOUT,
+            connect=SUPABASE_CONNECT_TIMEOUT,
+            pool=SUPABASE_POOL_TIMEOUT
+        )
+    )
+
+
+async def init_http_client():
+    """Open the shared Supabase client (called on application startup)"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _build_http_client()
+    return _http_client
+
+
+async def close_http_client():
+    """Close the shared Supabase client and its pooled connections (called on shutdown)"""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared Supabase client, creating it if the lifespan has not run"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _build_http_client()
+    return _http_client
+
+
+# ========================
+# REQUEST COALESCING
+# ========================
+
+# Identical reads in flight, by key
+_in_flight: Dict[Tuple, "asyncio.Future"] = {}
+_coalesce_stats = {"calls": 0, "coalesced": 0}
+# Bumped when a write to the table starts, so reads issued after it never join
+# a fetch that may predate it (and never cache its result)
+_write_generations: Dict[str, int] = {}
+
+
+def _bump_generation(table: str):
+    _write_generations[table] = _write_generations.get(table, 0) + 1
+
+
+async def coalesce(key: Tuple, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run fetch() once for all concurrent callers with the same key
+
+    The first caller starts the upstream request; callers arriving while it is in
+    flight await the same result. Nothing is kept once it completes, so later
+    callers always get a fresh read. The result object is shared: do not mutate it.
+    """
+    _coalesce_stats["calls"] += 1
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(fetch())
+        _in_flight[key] = task
+
+        def forget(done):
+            if _in_flight.get(key) is done:
+                del _in_flight[key]
+
+        task.add_done_callback(forget)
+    else:
+        _coalesce_stats["coalesced"] += 1
+    # A cancelled caller must not cancel the request the others are waiting on
+    return await asyncio.shield(task)
+
+
+def get_coalesce_stats() -> Dict[str, Any]:
+    return {"name": "single_flight", "in_flight": len(_in_flight), **_coalesce_stats}
+
+
+# ========================
+# PAGINATION AND COUNTS
+# ========================
+
+# Page sizes for the paginated and streaming list endpoints
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+# Rows are ordered newest first; id breaks ties between equal timestamps
+KEYSET_ORDER = "created_at.desc,id.desc"
+
 
-async def get_all_users():
-    """Get all users from the database using Supabase REST API"""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers
-            )
-            
-            print(f"GET users - Status: {response.status_code}")
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"Error response: {response.text}")
-                return []
-        except Exception as e:
-            print(f"Error in get_all_users: {e}")
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Build an opaque cursor pointing just after the given row"""
+    raw = json.dumps([row["created_at"], str(row["id"])])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode a cursor into its (created_at, id) pair, raising ValueError if invalid"""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(created_at), str(UUID(str(row_id)))
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+
+
+async def _get_page(table: str, limit: int, cursor: Optional[str] = None,
+                    params: Optional[Dict[str, Any]] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Fetch one keyset page from a Supabase table
+
+    Returns the rows and the cursor for the next page (None on the last page).
+    Unlike the get_all_* helpers this raises on errors, so a failed page is never
+    mistaken for the end of the table.
+    """
+    query = dict(params or {})
+    if query.get("select"):
+        # The next cursor is built from the last row's created_at and id
+        columns = query["select"].split(",")
+        query["select"] = ",".join(columns + [c for c in ("created_at", "id") if c not in columns])
+    query["order"] = KEYSET_ORDER
+    query["limit"] = str(limit)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query["or"] = (
+            f'(created_at.lt."{created_at}",'
+            f'and(created_at.eq."{created_at}",id.lt.{row_id}))'
+        )
+
+    client = get_http_client()
+    response = await client.get(
+        f"{SUPABASE_URL}/rest/v1/{table}",
+        headers=headers,
+        params=query
+    )
+
+    print(f"GET {table} page - Status: {response.status_code}")
+
+    if response.status_code != 200:
+        print(f"Error response: {response.text}")
+        raise Exception(f"Supabase API error - Status: {response.status_code}, Response: {response.text}")
+
+    rows = response.json()
+    next_cursor = encode_cursor(rows[-1]) if len(rows) == limit else None
+    return rows, next_cursor
+
+
+async def iter_pages(fetch_page: Callable[[int, Optional[str]], Awaitable[Tuple[List[dict], Optional[str]]]],
+                     limit: int, cursor: Optional[str] = None) -> AsyncIterator[List[dict]]:
+    """
+    Yield pages from fetch_page until the last one
+
+    The next page is requested as soon as the current one arrives, so it loads
+    while the caller is still consuming the current page.
+    """
+    task = asyncio.ensure_future(fetch_page(limit, cursor))
+    try:
+        while task is not None:
+            rows, next_cursor = await task
+            task = asyncio.ensure_future(fetch_page(limit, next_cursor)) if next_cursor else None
+            if rows:
+                yield rows
+    finally:
+        if task is not None and not task.done():
+            task.cancel()
+
+
+async def count_rows(table: str, params: Optional[Dict[str, Any]] = None, mode: str = "exact") -> Optional[int]:
+    """
+    Count rows matching params without downloading them
+
+    Uses PostgREST's Prefer: count=<mode> with an empty range and reads the total
+    from the Content-Range header. mode is "exact", "planned" or "estimated".
+    """
+    client = get_http_client()
+    try:
+        request_headers = dict(headers)
+        request_headers["Prefer"] = f"count={mode}"
+        request_headers["Range-Unit"] = "items"
+        request_headers["Range"] = "0-0"
+        response = await client.head(
+            f"{SUPABASE_URL}/rest/v1/{table}",
+            headers=request_headers,
+            params={**(params or {}), "select": "id"}
+        )
+
+        print(f"COUNT {table} - Status: {response.status_code}")
+
+        content_range = response.headers.get("content-range", "")
+        if response.status_code in (200, 206) and "/" in content_range:
+            total = content_range.rsplit("/", 1)[1]
+            return int(total) if total != "*" else None
+        print(f"Error response: HTTP {response.status_code}")
+        return None
+    except Exception as e:
+        print(f"Error in count_rows: {e}")
+        return None
+
+
+# ========================
+# PROJECTION AND FILTERS
+# ========================
+
+# Columns a caller may select (and filter on) per table
+USER_COLUMNS = (
+    "id", "first_name", "last_name", "phone", "age", "email", "street_address",
+    "city", "state", "postal_code", "country", "created_at", "updated_at"
+)
+LEAD_COLUMNS = (
+    "id", "form_id", "response_id", "first_name", "last_name", "phone", "email",
+    "responses", "created_at"
+)
+
+
+def parse_select(fields: Optional[str], allowed_columns: Tuple[str, ...]) -> Optional[str]:
+    """
+    Validate a comma separated column list for PostgREST's select
+
+    Returns None for "all columns". Raises ValueError for unknown columns, so
+    clients cannot pass arbitrary select syntax (embeds, casts) through.
+    """
+    if not fields:
+        return None
+    columns = list(dict.fromkeys(column.strip() for column in fields.split(",") if column.strip()))
+    unknown = [column for column in columns if column not in allowed_columns]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed_columns)}")
+    return ",".join(columns) or None
+
+
+def build_filters(phone: Optional[str] = None, email: Optional[str] = None,
+                  form_id: Optional[UUID] = None, created_after: Optional[str] = None,
+                  created_before: Optional[str] = None) -> Dict[str, str]:
+    """
+    PostgREST filters on indexed columns (equality, created_at range)
+
+    created_after is inclusive, created_before exclusive.
+    """
+    filters = {}
+    if phone:
+        filters["phone"] = f"eq.{phone}"
+    if email:
+        filters["email"] = f"eq.{email}"
+    if form_id:
+        filters["form_id"] = f"eq.{form_id}"
+    if created_after and created_before:
+        # Two conditions on one column need an explicit and=()
+        filters["and"] = f'(created_at.gte."{created_after}",created_at.lt."{created_before}")'
+    elif created_after:
+        filters["created_at"] = f"gte.{created_after}"
+    elif created_before:
+        filters["created_at"] = f"lt.{created_before}"
+    return filters
+
+
+def _query_params(select: Optional[str] = None, filters: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    params = dict(filters or {})
+    if select:
+        params["select"] = select
+    return params
+
+
+async def get_all_users(select: Optional[str] = None, filters: Optional[Dict[str, str]] = None):
+    """Get all users from the database using Supabase REST API (optionally projected and filtered)"""
+    client = get_http_client()
+    try:
+        response = await client.get(
+            f"{SUPABASE_URL}/rest/v1/users",
+            headers=headers,
+            params=_query_params(select, filters)
+        )
+        
+        print(f"GET users - Status: {response.status_code}")
+        
+        if response.status_code == 200:
+            return response.json()
+        else:
+            print(f"Error response: {response.text}")
             return []
+    except Exception as e:
+        print(f"Error in get_all_users: {e}")
+        return []
+
+
+async def get_users_page(limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                         select: Optional[str] = None, filters: Optional[Dict[str, str]] = None):
+    """Get one page of users, newest first, using keyset pagination"""
+    return await _get_page("users", limit, cursor, _query_params(select, filters))
 
 
 async def get_user_by_id(user_id):
     """Get a user by their ID using Supabase REST API"""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
-                params={"id": f"eq.{user_id}"}
-            )
-            
-            print(f"GET user by ID - Status: {response.status_code}")
-            
-            if response.status_code == 200 and response.json():
-                return response.json()[0]
-            else:
-                print(f"Error response: {response.text}")
-                return None
-        except Exception as e:
-            print(f"Error in get_user_by_id: {e}")
+    client = get_http_client()
+    try:
+        response = await client.get(
+            f"{SUPABASE_URL}/rest/v1/users",
+            headers=headers,
+            params={"id": f"eq.{user_id}"}
+        )
+        
+        print(f"GET user by ID - Status: {response.status_code}")
+        
+        if response.status_code == 200 and response.json():
+            return response.json()[0]
+        else:
+            print(f"Error response: {response.text}")
             return None
+    except Exception as e:
+        print(f"Error in get_user_by_id: {e}")
+        return None
 
 
 async def create_user(user_data):
     """Create a new user in the database using Supabase REST API"""
-    async with httpx.AsyncClient() as client:
-        try:
-            print(f"Creating user with data: {user_data}")
-            
-            response = await client.post(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
-                json=user_data
-            )
-            
-            print(f"POST user - Status: {response.status_code}")
-            print(f"Response: {response.text}")
-            
-            if response.status_code in (201, 200):
-                return response.json()
-            elif response.status_code == 409:
-                # Handle duplicate key constraint
-                try:
-                    error_data = response.json()
-                    if "duplicate key value violates unique constraint" in error_data.get("message", ""):
-                        if "users_phone_key" in error_data.get("message", ""):
-                            raise Exception(f"Usuário com telefone {user_data.get('phone')} já existe")
-                        else:
-                            raise Exception("Usuário já existe no banco de dados")
+    client = get_http_client()
+    try:
+        print(f"Creating user with data: {user_data}")
+        
+        response = await client.post(
+            f"{SUPABASE_URL}/rest/v1/users",
+            headers=headers,
+            json=user_data
+        )
+        
+        print(f"POST user - Status: {response.status_code}")
+        print(f"Response: {response.text}")
+        
+        if response.status_code in (201, 200):
+            return response.json()
+        elif response.status_code == 409:
+            # Handle duplicate key constraint
+            try:
+                error_data = response.json()
+                if "duplicate key value violates unique constraint" in error_data.get("message", ""):
+                    if "users_phone_key" in error_data.get("message", ""):
+                        raise Exception(f"Usuário com telefone {user_data.get('phone')} já existe")
                     else:
-                        raise Exception(f"Conflict error: {error_data.get('message', 'Unknown conflict')}")
-                except (json.JSONDecodeError, KeyError):
-                    raise Exception("Usuário já existe no banco de dados")
-            else:
-                print(f"Error creating user: {response.text}")
-                try:
-                    error_data = response.json()
-                    error_message = error_data.get("message", f"HTTP {response.status_code}")
-                    raise Exception(f"Erro ao criar usuário: {error_message}")
-                except (json.JSONDecodeError, KeyError):
-                    raise Exception(f"Erro ao criar usuário: HTTP {response.status_code}")
-        except Exception as e:
-            print(f"Error in create_user: {e}")
-            # Re-raise the exception to be handled by the calling function
-            raise e
-
-
-async def create_users_batch(users_data: List[dict]):
-    """Create multiple users in the database using Supabase REST API"""
-    async with httpx.AsyncClient() as client:
-        try:
-            print(f"Creating {len(users_data)} users in batch")
-            print(f"Sample user data: {users_data[0] if users_data else 'No data'}")
-            
-            response = await client.post(
-                f"{SUPABASE_URL}/rest/v1/users",
-                headers=headers,
-                json=users_data,
-                timeout=30.0  # Add timeout
-            )
-            
-            print(f"POST batch users - Status: {response.status_code}")
-            print(f"Response: {response.text}")
-            
-            if response.status_code in (201, 200):
-                result = response.json()
-                print(f"Successfully created {len(result)} users")
-                return result
-            else:
-                error_msg = f"Supabase API error - Status: {response.status_code}, Response: {response.text}"
-                print(error_msg)
-                raise Exception(error_msg)
-        except httpx.TimeoutException:
-            error_msg = "Request timeout - Supabase took too long to respond"
-            print(error_msg)
-            raise Exception(error_msg)
-        except httpx.RequestError as e:
-            error_msg = f"Network error connecting to Supabase: {str(e)}"
+                        raise Exception("Usuário já existe no banco de dados")
+                else:
+                    raise Exception(f"Conflict error: {error_data.get('message', 'Unknown conflict')}")
+            except (json.JSONDecodeError, KeyError):
+                raise Exception("Usuário já existe no banco de dados")
+        else:
+            print(f"Error creating user: {response.text}")
+            try:
+                error_data = response.json()
+                error_message = error_data.get("message", f"HTTP {response.status_code}")
+                raise Exception(f"Erro ao criar usuário: {error_message}")
+            except (json.JSONDecodeError, KeyError):
+                raise Exception(f"Erro ao criar usuário: HTTP {response.status_code}")
+    except Exception as e:
+        print(f"Error in create_user: {e}")
+        # Re-raise the exception to be handled by the calling function
+        raise e
+
+
+# PostgREST answers 400 (bad value, too long, not null...) or 409 (constraint
+# violation) when the database itself refused the rows
+REJECTED_STATUS_CODES = (400, 409)
+
+
+class RowsRejectedError(Exception):
+    """The database rejected the rows themselves; sending them again will fail again"""
+
+
+def _batch_request_options(rows: List[dict], on_conflict: Optional[str] = None,
+                           resolution: Optional[str] = None) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Build headers and query params for a PostgREST bulk insert
+
+    Args:
+        rows: Rows being inserted
+        on_conflict: Comma separated unique columns used to detect conflicts
+        resolution: "ignore-duplicates" or "merge-duplicates" to upsert instead of failing
+
+    Returns:
+        Tuple of (headers, params)
+    """
+    request_headers = dict(headers)
+    if resolution:
+        request_headers["Prefer"] = f"return=representation,resolution={resolution}"
+
+    # Rows may omit optional keys; listing the columns lets PostgREST fill them with NULL
+    # instead of rejecting the whole batch because the objects' keys differ
+    columns = dict.fromkeys(key for row in rows for key in row)
+
+    params = {"columns": ",".join(columns)}
+    if on_conflict:
+        params["on_conflict"] = on_conflict
+    return request_headers, params
+
+
+async def create_users_batch(users_data: List[dict], on_conflict: Optional[str] = None,
+                             resolution: Optional[str] = None, returning: Optional[str] = None):
+    """
+    Create multiple users in the database using Supabase REST API
+
+    With on_conflict="phone" and resolution="ignore-duplicates" existing phones are
+    skipped and only the newly inserted users are returned. `returning` limits the
+    columns sent back (e.g. "phone") for large imports.
+    """
+    client = get_http_client()
+    try:
+        print(f"Creating {len(users_data)} users in batch")
+        
+        request_headers, params = _batch_request_options(users_data, on_conflict, resolution)
+        if returning:
+            params["select"] = returning
+        response = await client.post(
+            f"{SUPABASE_URL}/rest/v1/users",
+            headers=request_headers,
+            params=params,
+            json=users_data,
+            timeout=30.0  # Add timeout
+        )
+        
+        print(f"POST batch users - Status: {response.status_code}")
+        
+        if response.status_code in (201, 200):
+            result = response.json()
+            print(f"Successfully created {len(result)} users")
+            return result
+        else:
+            error_msg = f"Supabase API error - Status: {response.status_code}, Response: {response.text}"
             print(error_msg)
             raise Exception(error_msg)
-        except Exception as e:
-            print(f"Error in create_users_batch: {e}")
-            raise Exception(f"Database error: {str(e)}")
+    except httpx.TimeoutException:
+        error_msg = "Request timeout - Supabase took too long to respond"
+        print(error_msg)
+        raise Exception(error_msg)
+    except httpx.RequestError as e:
+        error_msg = f"Network error connecting to Supabase: {str(e)}"
+        print(error_msg)
+        raise Exception(error_msg)
+    except Exception as e:
+        print(f"Error in create_users_batch: {e}")
+        raise Exception(f"Database error: {str(e)}")
 
 
 # ========================
@@ -155,241 +513,494 @@ async def create_users_batch(users_data: List[dict]):
 
 async def get_all_forms():
     """Get all forms from the database using Supabase REST API"""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/forms",
-                headers=headers
-            )
-            
-            print(f"GET forms - Status: {response.status_code}")
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"Error response: {response.text}")
-                return []
-        except Exception as e:
-            print(f"Error in get_all_forms: {e}")
+    client = get_http_client()
+    try:
+        response = await client.get(
+            f"{SUPABASE_URL}/rest/v1/forms",
+            headers=headers
+        )
+        
+        print(f"GET forms - Status: {response.status_code}")
+        
+        if response.status_code == 200:
+            return response.json()
+        else:
+            print(f"Error response: {response.text}")
             return []
+    except Exception as e:
+        print(f"Error in get_all_forms: {e}")
+        return []
+
+
+async def get_google_linked_forms():
+    """Get every form linked to a Google Form (the forms the sync scheduler handles)"""
+    client = get_http_client()
+    response = await client.get(
+        f"{SUPABASE_URL}/rest/v1/forms",
+        headers=headers,
+        params={"google_form_id": "not.is.null", "order": "created_at.asc"}
+    )
+    
+    print(f"GET Google-linked forms - Status: {response.status_code}")
+    
+    if response.status_code != 200:
+        raise Exception(f"Supabase API error - Status: {response.status_code}, Response: {response.text}")
+    return response.json()
+
+
+def invalidate_form_cache(form_id: Optional[UUID] = None):
+    """Drop one form (or every form) from the form cache; call after writing forms"""
+    _bump_generation("forms")
+    if form_id is None:
+        _form_cache.clear()
+    else:
+        _form_cache.invalidate(str(form_id))
+
+
+def get_form_cache_stats() -> Dict[str, Any]:
+    return _form_cache.stats()
 
 
 async def get_form_by_id(form_id: UUID):
-    """Get a form by its ID using Supabase REST API"""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/forms",
-                headers=headers,
-                params={"id": f"eq.{form_id}"}
-            )
-            
-            print(f"GET form by ID - Status: {response.status_code}")
-            
-            if response.status_code == 200 and response.json():
-                return response.json()[0]
-            else:
-                print(f"Error response: {response.text}")
-                return None
-        except Exception as e:
-            print(f"Error in get_form_by_id: {e}")
+    """Get a form by its ID using Supabase REST API (served from the form cache when possible)"""
+    cached = _form_cache.get(str(form_id))
+    if cached is not None:
+        return cached
+    
+    generation = _write_generations.get("forms", 0)
+    return await coalesce(("form", str(form_id), generation), partial(_fetch_form_by_id, form_id, generation))
+
+
+async def _fetch_form_by_id(form_id: UUID, generation: int):
+    client = get_http_client()
+    try:
+        response = await client.get(
+            f"{SUPABASE_URL}/rest/v1/forms",
+            headers=headers,
+            params={"id": f"eq.{form_id}"}
+        )
+        
+        print(f"GET form by ID - Status: {response.status_code}")
+        
+        if response.status_code == 200 and response.json():
+            form = response.json()[0]
+            # Skip caching if a form write started while this read was in flight
+            if _write_generations.get("forms", 0) == generation:
+                _form_cache.set(str(form_id), form)
+            return form
+        else:
+            print(f"Error response: {response.text}")
             return None
+    except Exception as e:
+        print(f"Error in get_form_by_id: {e}")
+        return None
 
 
 async def create_form(form_data: dict):
     """Create a new form in the database using Supabase REST API"""
-    async with httpx.AsyncClient() as client:
-        try:
-            print(f"Creating form with data: {form_data}")
-            
-            response = await client.post(
-                f"{SUPABASE_URL}/rest/v1/forms",
-                headers=headers,
-                json=form_data
-            )
-            
-            print(f"POST form - Status: {response.status_code}")
-            print(f"Response: {response.text}")
-            
-            if response.status_code in (201, 200):
-                return response.json()
-            elif response.status_code == 409:
-                # Handle duplicate key constraint
-                try:
-                    error_data = response.json()
-                    if "duplicate key value violates unique constraint" in error_data.get("message", ""):
-                        if "forms_title_key" in error_data.get("message", ""):
-                            raise Exception(f"Formulário com título '{form_data.get('title')}' já existe")
-                        else:
-                            raise Exception("Formulário já existe no banco de dados")
+    client = get_http_client()
+    try:
+        print(f"Creating form with data: {form_data}")
+        
+        response = await client.post(
+            f"{SUPABASE_URL}/rest/v1/forms",
+            headers=headers,
+            json=form_data
+        )
+        
+        print(f"POST form - Status: {response.status_code}")
+        print(f"Response: {response.text}")
+        
+        if response.status_code in (201, 200):
+            created = response.json()
+            for form in created if isinstance(created, list) else [created]:
+                invalidate_form_cache(form.get('id'))
+            return created
+        elif response.status_code == 409:
+            # Handle duplicate key constraint
+            try:
+                error_data = response.json()
+                if "duplicate key value violates unique constraint" in error_data.get("message", ""):
+                    if "forms_title_key" in error_data.get("message", ""):
+                        raise Exception(f"Formulário com título '{form_data.get('title')}' já existe")
                     else:
-                        raise Exception(f"Conflict error: {error_data.get('message', 'Unknown conflict')}")
-                except (json.JSONDecodeError, KeyError):
-                    raise Exception("Formulário já existe no banco de dados")
-            else:
-                print(f"Error creating form: {response.text}")
-                try:
-                    error_data = response.json()
-                    error_message = error_data.get("message", f"HTTP {response.status_code}")
-                    raise Exception(f"Erro ao criar formulário: {error_message}")
-                except (json.JSONDecodeError, KeyError):
-                    raise Exception(f"Erro ao criar formulário: HTTP {response.status_code}")
-        except Exception as e:
-            print(f"Error in create_form: {e}")
-            # Re-raise the exception to be handled by the calling function
-            raise e
+                        raise Exception("Formulário já existe no banco de dados")
+                else:
+                    raise Exception(f"Conflict error: {error_data.get('message', 'Unknown conflict')}")
+            except (json.JSONDecodeError, KeyError):
+                raise Exception("Formulário já existe no banco de dados")
+        else:
+            print(f"Error creating form: {response.text}")
+            try:
+                error_data = response.json()
+                error_message = error_data.get("message", f"HTTP {response.status_code}")
+                raise Exception(f"Erro ao criar formulário: {error_message}")
+            except (json.JSONDecodeError, KeyError):
+                raise Exception(f"Erro ao criar formulário: HTTP {response.status_code}")
+    except Exception as e:
+        print(f"Error in create_form: {e}")
+        # Re-raise the exception to be handled by the calling function
+        raise e
+
+
+async def update_form(form_id: UUID, fields: dict):
+    """Update fields of a form using Supabase REST API; returns the updated form"""
+    _bump_generation("forms")
+    client = get_http_client()
+    response = await client.patch(
+        f"{SUPABASE_URL}/rest/v1/forms",
+        headers=headers,
+        params={"id": f"eq.{form_id}"},
+        json=fields
+    )
+    
+    print(f"PATCH form - Status: {response.status_code}")
+    
+    if response.status_code != 200:
+        raise Exception(f"Erro ao atualizar formulário: HTTP {response.status_code} - {response.text}")
+    
+    rows = response.json()
+    invalidate_form_cache(form_id)
+    return rows[0] if rows else None
 
 
 # ========================
 # LEADS OPERATIONS  
 # ========================
 
-async def get_all_leads():
-    """Get all leads from the database using Supabase REST API"""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/leads",
-                headers=headers
-            )
-            
-            print(f"GET leads - Status: {response.status_code}")
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"Error response: {response.text}")
-                return []
-        except Exception as e:
-            print(f"Error in get_all_leads: {e}")
+async def get_all_leads(select: Optional[str] = None, filters: Optional[Dict[str, str]] = None):
+    """Get all leads from the database using Supabase REST API (optionally projected and filtered)"""
+    client = get_http_client()
+    try:
+        response = await client.get(
+            f"{SUPABASE_URL}/rest/v1/leads",
+            headers=headers,
+            params=_query_params(select, filters)
+        )
+        
+        print(f"GET leads - Status: {response.status_code}")
+        
+        if response.status_code == 200:
+            return response.json()
+        else:
+            print(f"Error response: {response.text}")
             return []
+    except Exception as e:
+        print(f"Error in get_all_leads: {e}")
+        return []
 
 
-async def get_leads_by_form_id(form_id: UUID):
-    """Get all leads for a specific form using Supabase REST API"""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/leads",
-                headers=headers,
-                params={"form_id": f"eq.{form_id}"}
-            )
-            
-            print(f"GET leads by form ID - Status: {response.status_code}")
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"Error response: {response.text}")
-                return []
-        except Exception as e:
-            print(f"Error in get_leads_by_form_id: {e}")
+async def get_leads_page(limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                         form_id: Optional[UUID] = None, select: Optional[str] = None,
+                         filters: Optional[Dict[str, str]] = None):
+    """Get one page of leads (optionally for a single form), newest first"""
+    params = _query_params(select, filters)
+    if form_id:
+        params["form_id"] = f"eq.{form_id}"
+    return await _get_page("leads", limit, cursor, params)
+
+
+async def get_leads_by_form_id(form_id: UUID, select: Optional[str] = None,
+                               filters: Optional[Dict[str, str]] = None):
+    """Get all leads for a specific form using Supabase REST API (concurrent calls share one request)"""
+    params = _query_params(select, filters)
+    params["form_id"] = f"eq.{form_id}"
+    generation = _write_generations.get("leads", 0)
+    key = ("leads_by_form", generation, *sorted(params.items()))
+    return await coalesce(key, partial(_fetch_leads_by_form_id, params))
+
+
+async def _fetch_leads_by_form_id(params: Dict[str, str]):
+    client = get_http_client()
+    try:
+        response = await client.get(
+            f"{SUPABASE_URL}/rest/v1/leads",
+            headers=headers,
+            params=params
+        )
+        
+        print(f"GET leads by form ID - Status: {response.status_code}")
+        
+        if response.status_code == 200:
+            return response.json()
+        else:
+            print(f"Error response: {response.text}")
             return []
+    except Exception as e:
+        print(f"Error in get_leads_by_form_id: {e}")
+        return []
 
 
-async def get_leads_by_ids(lead_ids: List[UUID]):
-    """Get specific leads by their IDs using Supabase REST API"""
-    async with httpx.AsyncClient() as client:
-        try:
-            # Convert UUIDs to strings for the query
-            id_strings = [str(lead_id) for lead_id in lead_ids]
-            id_filter = f"in.({','.join(id_strings)})"
-            
-            response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/leads",
-                headers=headers,
-                params={"id": id_filter}
-            )
-            
-            print(f"GET leads by IDs - Status: {response.status_code}")
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"Error response: {response.text}")
-                return []
-        except Exception as e:
-            print(f"Error in get_leads_by_ids: {e}")
+async def get_leads_by_ids(lead_ids: List[UUID], select: Optional[str] = None):
+    """Get specific leads by their IDs using Supabase REST API (optionally projected)"""
+    client = get_http_client()
+    try:
+        # Convert UUIDs to strings for the query
+        id_strings = [str(lead_id) for lead_id in lead_ids]
+        id_filter = f"in.({','.join(id_strings)})"
+        
+        response = await client.get(
+            f"{SUPABASE_URL}/rest/v1/leads",
+            headers=headers,
+            params=_query_params(select, {"id": id_filter})
+        )
+        
+        print(f"GET leads by IDs - Status: {response.status_code}")
+        
+        if response.status_code == 200:
+            return response.json()
+        else:
+            print(f"Error response: {response.text}")
             return []
+    except Exception as e:
+        print(f"Error in get_leads_by_ids: {e}")
+        return []
 
 
 async def create_lead(lead_data: dict):
     """Create a new lead in the database using Supabase REST API"""
-    async with httpx.AsyncClient() as client:
-        try:
-            print(f"Creating lead with data: {lead_data}")
-            
-            response = await client.post(
-                f"{SUPABASE_URL}/rest/v1/leads",
-                headers=headers,
-                json=lead_data
-            )
-            
-            print(f"POST lead - Status: {response.status_code}")
-            print(f"Response: {response.text}")
-            
-            if response.status_code in (201, 200):
-                return response.json()
-            elif response.status_code == 409:
-                # Handle duplicate key constraint
-                try:
-                    error_data = response.json()
-                    if "duplicate key value violates unique constraint" in error_data.get("message", ""):
-                        if "leads_phone_key" in error_data.get("message", ""):
-                            raise Exception(f"Lead com telefone {lead_data.get('phone')} já existe")
-                        else:
-                            raise Exception("Lead já existe no banco de dados")
+    _bump_generation("leads")
+    client = get_http_client()
+    try:
+        print(f"Creating lead with data: {lead_data}")
+        
+        response = await client.post(
+            f"{SUPABASE_URL}/rest/v1/leads",
+            headers=headers,
+            json=lead_data
+        )
+        
+        print(f"POST lead - Status: {response.status_code}")
+        print(f"Response: {response.text}")
+        
+        if response.status_code in (201, 200):
+            return response.json()
+        elif response.status_code == 409:
+            # Handle duplicate key constraint
+            try:
+                error_data = response.json()
+                if "duplicate key value violates unique constraint" in error_data.get("message", ""):
+                    if "leads_phone_key" in error_data.get("message", ""):
+                        raise Exception(f"Lead com telefone {lead_data.get('phone')} já existe")
                     else:
-                        raise Exception(f"Conflict error: {error_data.get('message', 'Unknown conflict')}")
-                except (json.JSONDecodeError, KeyError):
-                    raise Exception("Lead já existe no banco de dados")
-            else:
-                print(f"Error creating lead: {response.text}")
-                try:
-                    error_data = response.json()
-                    error_message = error_data.get("message", f"HTTP {response.status_code}")
-                    raise Exception(f"Erro ao criar lead: {error_message}")
-                except (json.JSONDecodeError, KeyError):
-                    raise Exception(f"Erro ao criar lead: HTTP {response.status_code}")
-        except Exception as e:
-            print(f"Error in create_lead: {e}")
-            # Re-raise the exception to be handled by the calling function
-            raise e
-
-
-async def create_leads_batch(leads_data: List[dict]):
-    """Create multiple leads in the database using Supabase REST API"""
-    async with httpx.AsyncClient() as client:
-        try:
-            print(f"Creating {len(leads_data)} leads in batch")
-            print(f"Sample lead data: {leads_data[0] if leads_data else 'No data'}")
-            
-            response = await client.post(
-                f"{SUPABASE_URL}/rest/v1/leads",
-                headers=headers,
-                json=leads_data,
-                timeout=30.0  # Add timeout
-            )
-            
-            print(f"POST batch leads - Status: {response.status_code}")
-            print(f"Response: {response.text}")
-            
-            if response.status_code in (201, 200):
-                result = response.json()
-                print(f"Successfully created {len(result)} leads")
-                return result
-            else:
-                error_msg = f"Supabase API error - Status: {response.status_code}, Response: {response.text}"
-                print(error_msg)
-                raise Exception(error_msg)
-        except httpx.TimeoutException:
-            error_msg = "Request timeout - Supabase took too long to respond"
+                        raise Exception("Lead já existe no banco de dados")
+                else:
+                    raise Exception(f"Conflict error: {error_data.get('message', 'Unknown conflict')}")
+            except (json.JSONDecodeError, KeyError):
+                raise Exception("Lead já existe no banco de dados")
+        else:
+            print(f"Error creating lead: {response.text}")
+            try:
+                error_data = response.json()
+                error_message = error_data.get("message", f"HTTP {response.status_code}")
+                raise Exception(f"Erro ao criar lead: {error_message}")
+            except (json.JSONDecodeError, KeyError):
+                raise Exception(f"Erro ao criar lead: HTTP {response.status_code}")
+    except Exception as e:
+        print(f"Error in create_lead: {e}")
+        # Re-raise the exception to be handled by the calling function
+        raise e
+
+
+async def create_leads_batch(leads_data: List[dict], on_conflict: Optional[str] = None,
+                             resolution: Optional[str] = None, returning: Optional[str] = None):
+    """
+    Create multiple leads in the database using Supabase REST API (optionally as an upsert)
+
+    `returning` limits the columns sent back (e.g. "id" when only the count matters).
+    """
+    _bump_generation("leads")
+    client = get_http_client()
+    try:
+        print(f"Creating {len(leads_data)} leads in batch")
+        
+        request_headers, params = _batch_request_options(leads_data, on_conflict, resolution)
+        if returning:
+            params["select"] = returning
+        response = await client.post(
+            f"{SUPABASE_URL}/rest/v1/leads",
+            headers=request_headers,
+            params=params,
+            json=leads_data,
+            timeout=30.0  # Add timeout
+        )
+        
+        print(f"POST batch leads - Status: {response.status_code}")
+        
+        if response.status_code in (201, 200):
+            result = response.json()
+            print(f"Successfully created {len(result)} leads")
+            return result
+        else:
+            error_msg = f"Supabase API error - Status: {response.status_code}, Response: {response.text}"
             print(error_msg)
+            if response.status_code in REJECTED_STATUS_CODES:
+                raise RowsRejectedError(error_msg)
             raise Exception(error_msg)
-        except httpx.RequestError as e:
-            error_msg = f"Network error connecting to Supabase: {str(e)}"
+    except RowsRejectedError:
+        raise
+    except httpx.TimeoutException:
+        error_msg = "Request timeout - Supabase took too long to respond"
+        print(error_msg)
+        raise Exception(error_msg)
+    except httpx.RequestError as e:
+        error_msg = f"Network error connecting to Supabase: {str(e)}"
+        print(error_msg)
+        raise Exception(error_msg)
+    except Exception as e:
+        print(f"Error in create_leads_batch: {e}")
+        raise Exception(f"Database error: {str(e)}") 
+
+# ========================
+# STATISTICS (AGGREGATE VIEWS)
+# ========================
+
+# Most rows recent_leads_activity returns (the view itself stops at 100)
+RECENT_LEADS_MAX = 100
+
+
+async def _get_view(view: str, params: Dict[str, str]) -> List[dict]:
+    """Read rows of an aggregate view; raises on errors like _get_page"""
+    client = get_http_client()
+    response = await client.get(
+        f"{SUPABASE_URL}/rest/v1/{view}",
+        headers=headers,
+        params=params
+    )
+
+    print(f"GET {view} - Status: {response.status_code}")
+
+    if response.status_code != 200:
+        print(f"Error response: {response.text}")
+        raise Exception(f"Supabase API error - Status: {response.status_code}, Response: {response.text}")
+    return response.json()
+
+
+async def get_forms_with_lead_counts(form_id: Optional[UUID] = None) -> List[dict]:
+    """Forms with their lead count, computed by the database (forms_with_lead_counts)"""
+    params = {"order": "created_at.desc"}
+    if form_id:
+        params["id"] = f"eq.{form_id}"
+    return await _get_view("forms_with_lead_counts", params)
+
+
+async def get_recent_leads_activity(limit: int = RECENT_LEADS_MAX, form_id: Optional[UUID] = None) -> List[dict]:
+    """
+    Newest leads with their form title (recent_leads_activity)
+
+    The view only holds the 100 newest leads overall, so form_id narrows those
+    rather than returning that form's 100 newest.
+    """
+    params = {"order": "created_at.desc", "limit": str(min(limit, RECENT_LEADS_MAX))}
+    if form_id:
+        params["form_id"] = f"eq.{form_id}"
+    return await _get_view("recent_leads_activity", params)
+
+
+async def get_form_daily_lead_volume(form_id: UUID, since: Optional[str] = None,
+                                     until: Optional[str] = None) -> List[dict]:
+    """
+    Leads per UTC day of one form, oldest day first (form_daily_lead_volume)
+
+    since and until are inclusive dates (YYYY-MM-DD); days without leads are omitted.
+    """
+    params = {"form_id": f"eq.{form_id}", "select": "day,lead_count", "order": "day.asc"}
+    if since and until:
+        params["and"] = f"(day.gte.{since},day.lte.{until})"
+    elif since:
+        params["day"] = f"gte.{since}"
+    elif until:
+        params["day"] = f"lte.{until}"
+    return await _get_view("form_daily_lead_volume", params)
+
+
+# ========================
+# MESSAGE OUTBOX OPERATIONS
+# ========================
+
+async def create_outbox_messages(messages: List[dict]):
+    """
+    Enqueue messages in the outbox
+
+    Rows for a phone already queued in the same campaign are ignored, so enqueuing
+    a campaign twice never produces duplicate sends. Returns the rows inserted.
+    """
+    client = get_http_client()
+    try:
+        print(f"Enqueuing {len(messages)} outbox messages")
+
+        request_headers, params = _batch_request_options(messages, "campaign_id,phone", "ignore-duplicates")
+        response = await client.post(
+            f"{SUPABASE_URL}/rest/v1/message_outbox",
+            headers=request_headers,
+            params=params,
+            json=messages,
+            timeout=30.0
+        )
+
+        print(f"POST batch outbox messages - Status: {response.status_code}")
+
+        if response.status_code in (201, 200):
+            return response.json()
+        else:
+            error_msg = f"Supabase API error - Status: {response.status_code}, Response: {response.text}"
             print(error_msg)
             raise Exception(error_msg)
-        except Exception as e:
-            print(f"Error in create_leads_batch: {e}")
-            raise Exception(f"Database error: {str(e)}") 
\ No newline at end of file
+    except httpx.RequestError as e:
+        error_msg = f"Network error connecting to Supabase: {str(e)}"
+        print(error_msg)
+        raise Exception(error_msg)
+
+
+async def claim_outbox_messages(worker_id: str, batch_size: int, lease_seconds: int, max_attempts: int):
+    """Claim pending outbox rows for a worker through the claim_outbox_messages RPC"""
+    client = get_http_client()
+    try:
+        response = await client.post(
+            f"{SUPABASE_URL}/rest/v1/rpc/claim_outbox_messages",
+            headers=headers,
+            json={
+                "p_worker_id": worker_id,
+                "p_batch_size": batch_size,
+                "p_lease_seconds": lease_seconds,
+                "p_max_attempts": max_attempts
+            }
+        )
+
+        print(f"RPC claim_outbox_messages - Status: {response.status_code}")
+
+        if response.status_code == 200:
+            return response.json()
+        else:
+            print(f"Error response: {response.text}")
+            return []
+    except Exception as e:
+        print(f"Error in claim_outbox_messages: {e}")
+        return []
+
+
+async def update_outbox_message(message_id: UUID, worker_id: str, fields: dict) -> bool:
+    """
+    Record the outcome of one outbox message
+
+    The update only applies while the row is still locked by this worker, so a
+    worker whose lease expired cannot overwrite the row's new owner. Returns False
+    when nothing was updated (lease lost) or the request failed.
+    """
+    client = get_http_client()
+    try:
+        response = await client.patch(
+            f"{SUPABASE_URL}/rest/v1/message_outbox",
+            headers=headers,
+            params={"id": f"eq.{message_id}", "locked_by": f"eq.{worker_id}"},
+            json=fields
+        )
+
+        if response.status_code == 200:
+            # PostgREST answers 200 with [] when the filter matched no row
+            return bool(response.json())
+        print(f"Error updating outbox message {message_id}: {response.text}")
+        return False
+    except Exception as e:
+        print(f"Error in update_outbox_message: {e}")
+        return False
@@ -0,0 +1,155 @@
+import os
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Dict, Any
+
+from app.database import create_leads_batch, update_form, RowsRejectedError
+from app.google_forms import sync_form_responses_to_leads
+
+# Leads written per upsert request
+FORM_SYNC_CHUNK_SIZE = int(os.getenv("FORM_SYNC_CHUNK_SIZE", "500"))
+# Error messages returned in a sync result
+FORM_SYNC_MAX_ERRORS = 100
+
+
+def _to_google_timestamp(value: Optional[str]) -> Optional[str]:
+    """Convert a timestamp read from the database to RFC3339 UTC ("Zulu") for the Forms API"""
+    if not value:
+        return None
+    timestamp = datetime.fromisoformat(value.replace('Z', '+00:00')).astimezone(timezone.utc)
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+async def _upsert_leads_chunk(chunk: List[dict]) -> List[dict]:
+    """Upsert leads by response_id; re-synced responses update the existing lead"""
+    return await create_leads_batch(chunk, on_conflict="response_id", resolution="merge-duplicates",
+                                    returning="id")
+
+
+async def upsert_leads(leads: List[dict], chunk_size: int = FORM_SYNC_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Write leads in chunked batch upserts
+
+    A chunk rejected by the database is retried lead by lead, so one bad response
+    (e.g. a phone longer than the column) does not block the rest of its chunk.
+    Leads the database refuses as data go to `rejected`; writes that failed for
+    any other reason (network, timeouts, database unavailable) go to `errors`.
+
+    Returns:
+        Dict with upserted_count, errors and rejected ({"response_id", "error"})
+    """
+    upserted = 0
+    errors = []
+    rejected = []
+    for start in range(0, len(leads), chunk_size):
+        chunk = leads[start:start + chunk_size]
+        try:
+            upserted += len(await _upsert_leads_chunk(chunk))
+            continue
+        except Exception as e:
+            print(f"Batch upsert of {len(chunk)} leads failed, retrying one by one: {e}")
+
+        for lead in chunk:
+            try:
+                upserted += len(await _upsert_leads_chunk([lead]))
+            except RowsRejectedError as e:
+                if len(rejected) < FORM_SYNC_MAX_ERRORS:
+                    rejected.append({"response_id": lead.get('response_id'), "error": str(e)})
+            except Exception as e:
+                if len(errors) < FORM_SYNC_MAX_ERRORS:
+                    errors.append(f"Response {lead.get('response_id')}: {str(e)}")
+
+    return {"upserted_count": upserted, "errors": errors, "rejected": rejected}
+
+
+async def _record_sync_failure(form: Dict[str, Any], started: float, error: Exception):
+    """Store a failed sync on the form row; the watermark stays where it was"""
+    try:
+        await update_form(form['id'], {
+            "last_synced_at": datetime.now(timezone.utc).isoformat(),
+            "last_sync_duration_seconds": round(time.monotonic() - started, 3),
+            "last_sync_fetched_count": 0,
+            "last_sync_upserted_count": 0,
+            "last_sync_error": str(error)
+        })
+    except Exception as e:
+        print(f"Error recording sync failure of form {form['id']}: {e}")
+
+
+def sync_since(form: Dict[str, Any], full: bool = False) -> Optional[str]:
+    """Timestamp from which a form's responses are fetched (None for everything)"""
+    return None if full else _to_google_timestamp(form.get('last_response_submitted_at'))
+
+
+async def sync_form(form: Dict[str, Any], full: bool = False,
+                    prefetched: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Pull a form's Google responses into the leads table
+
+    Only responses submitted since the form's watermark are fetched, unless
+    full=True. Leads are upserted on response_id, so re-running a sync never
+    creates duplicates. The watermark is held back only when writes failed for a
+    transient reason; responses the database rejects as data would fail on every
+    sync, so the watermark moves past them and they are listed in the result and
+    in last_sync_error (a full sync retries them once the cause is fixed).
+    Duration, row counts and any error are recorded on the form row.
+
+    Args:
+        form: Form row (id, google_form_id, last_response_submitted_at, field_mapping)
+        full: Ignore the watermark and fetch every response
+        prefetched: {"responses", "error"} for this form from a batched fetch
+
+    Returns:
+        Dict describing the sync
+    """
+    if not form.get('google_form_id'):
+        raise ValueError("Form is not linked to a Google Form")
+
+    started = time.monotonic()
+    since = sync_since(form, full)
+    try:
+        if prefetched and prefetched.get('error'):
+            raise Exception(prefetched['error'])
+        leads, latest = await sync_form_responses_to_leads(
+            form['google_form_id'], str(form['id']), since, form.get('field_mapping') or None,
+            prefetched['responses'] if prefetched else None
+        )
+        result = await upsert_leads(leads)
+    except Exception as e:
+        await _record_sync_failure(form, started, e)
+        raise
+
+    if result['errors']:
+        last_error = result['errors'][0]
+    elif result['rejected']:
+        last_error = f"{len(result['rejected'])} responses rejected: " + "; ".join(
+            f"{failure['response_id']}: {failure['error']}" for failure in result['rejected']
+        )
+    else:
+        last_error = None
+
+    fields = {
+        "last_synced_at": datetime.now(timezone.utc).isoformat(),
+        "last_sync_duration_seconds": round(time.monotonic() - started, 3),
+        "last_sync_fetched_count": len(leads),
+        "last_sync_upserted_count": result['upserted_count'],
+        "last_sync_error": last_error
+    }
+    if latest and not result['errors']:
+        fields["last_response_submitted_at"] = latest
+    await update_form(form['id'], fields)
+
+    print(f"Synced form {form['id']}: {len(leads)} leads fetched, {result['upserted_count']} upserted")
+    return {
+        "form_id": str(form['id']),
+        "google_form_id": form['google_form_id'],
+        "full": full,
+        "since": since,
+        "fetched_leads": len(leads),
+        "upserted_count": result['upserted_count'],
+        "failed_count": len(leads) - result['upserted_count'],
+        "errors": result['errors'],
+        "rejected": result['rejected'],
+        "duration_seconds": fields["last_sync_duration_seconds"],
+        "watermark": fields.get("last_response_submitted_at", form.get('last_response_submitted_at'))
+    }
@@ -0,0 +1,145 @@
+import os
+import asyncio
+import tempfile
+import threading
+from datetime import datetime
+from typing import List, Optional
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+
+# Refresh the access token this many seconds before it expires
+GOOGLE_TOKEN_REFRESH_MARGIN = float(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", "300"))
+# Delay before the background refresher tries again after a failure
+GOOGLE_TOKEN_RETRY_DELAY = 30.0
+
+
+class GoogleCredentialManager:
+    """
+    Owns the OAuth credentials shared by every Google API call
+
+    Tokens are refreshed ahead of expiry by a background task, and callers that
+    find the token about to expire share a single in-flight refresh instead of
+    each refreshing on their own. token.json is rewritten atomically and only
+    when the token actually changed.
+    """
+
+    def __init__(self, scopes: List[str], credentials_file: Optional[str] = None,
+                 token_file: Optional[str] = None, refresh_margin: float = GOOGLE_TOKEN_REFRESH_MARGIN):
+        self.scopes = scopes
+        self.credentials_file = credentials_file or os.getenv("GOOGLE_CREDENTIALS_FILE", "credentials.json")
+        self.token_file = token_file or os.getenv("GOOGLE_TOKEN_FILE", "token.json")
+        self.refresh_margin = refresh_margin
+        self.credentials: Optional[Credentials] = None
+        self.refresh_count = 0
+        self._lock = threading.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _seconds_to_expiry(self) -> Optional[float]:
+        expiry = self.credentials.expiry if self.credentials else None
+        if expiry is None:
+            return None
+        # google-auth keeps expiry as a naive UTC datetime
+        return (expiry - datetime.utcnow()).total_seconds()
+
+    def _needs_refresh(self) -> bool:
+        if not self.credentials.token:
+            return True
+        remaining = self._seconds_to_expiry()
+        return remaining is not None and remaining <= self.refresh_margin
+
+    def _write_token(self):
+        """Write token.json through a temp file + os.replace so readers never see a partial file"""
+        directory = os.path.dirname(os.path.abspath(self.token_file))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".token-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as token:
+                token.write(self.credentials.to_json())
+                token.flush()
+                os.fsync(token.fileno())
+            os.replace(tmp_path, self.token_file)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _refresh_locked(self):
+        self.credentials.refresh(Request())
+        self.refresh_count += 1
+        self._write_token()
+        print(f"Google access token refreshed (expires {self.credentials.expiry})")
+
+    def load(self) -> Credentials:
+        """
+        Load credentials from token.json (blocking), refreshing or running the
+        login flow when needed. Later calls return the loaded credentials.
+        """
+        with self._lock:
+            if self.credentials:
+                return self.credentials
+
+            creds = None
+            # The file token.json stores the user's access and refresh tokens.
+            if os.path.exists(self.token_file):
+                creds = Credentials.from_authorized_user_file(self.token_file, self.scopes)
+
+            if creds and creds.refresh_token:
+                self.credentials = creds
+                if not creds.valid or self._needs_refresh():
+                    self._refresh_locked()
+            elif not creds or not creds.valid:
+                # No usable credentials available: let the user log in
+                if not os.path.exists(self.credentials_file):
+                    raise Exception(f"Google credentials file not found: {self.credentials_file}")
+
+                flow = InstalledAppFlow.from_client_secrets_file(self.credentials_file, self.scopes)
+                self.credentials = flow.run_local_server(port=0)
+                # Save the credentials for the next run
+                self._write_token()
+            else:
+                self.credentials = creds
+
+            return self.credentials
+
+    def ensure_fresh(self) -> Credentials:
+        """
+        Refresh the token if it expires within the refresh margin (blocking)
+
+        The check is lock-free while the token is fresh. Threads arriving while a
+        refresh is in flight wait for it and then reuse its token.
+        """
+        if not self.credentials:
+            return self.load()
+        if not self._needs_refresh():
+            return self.credentials
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self._needs_refresh() and self.credentials.refresh_token:
+                self._refresh_locked()
+        return self.credentials
+
+    async def _refresh_loop(self):
+        while True:
+            remaining = self._seconds_to_expiry()
+            delay = self.refresh_margin if remaining is None else remaining - self.refresh_margin
+            await asyncio.sleep(max(delay, 5.0))
+            try:
+                await asyncio.to_thread(self.ensure_fresh)
+            except Exception as e:
+                print(f"Error refreshing Google access token: {e}")
+                await asyncio.sleep(GOOGLE_TOKEN_RETRY_DELAY)
+
+    def start_background_refresh(self):
+        """Start refreshing ahead of expiry on the running event loop (idempotent)"""
+        if not self.credentials or not self.credentials.refresh_token:
+            return
+        if self._refresh_task and not self._refresh_task.done():
+            return
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop_background_refresh(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
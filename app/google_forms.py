@@ -1,16 +1,145 @@
 import os
-from typing import Dict, List, Optional, Any
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Any, Callable, Tuple
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
 from googleapiclient.errors import HttpError
 import json
 
+from app.cache import TTLCache
+from app.google_auth import GoogleCredentialManager
+from app.rate_limit import BlockingTokenBucket
+
 # If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/forms.body',
           'https://www.googleapis.com/auth/forms.responses.readonly']
 
+# The Google client library is synchronous: its calls run on a dedicated thread pool
+GOOGLE_API_CONCURRENCY = int(os.getenv("GOOGLE_API_CONCURRENCY", "4"))
+# Overall time an endpoint waits for a Google call (queueing included)
+GOOGLE_API_TIMEOUT = float(os.getenv("GOOGLE_API_TIMEOUT", "60"))
+# Socket timeout of each HTTP request made by the client library
+GOOGLE_HTTP_TIMEOUT = float(os.getenv("GOOGLE_HTTP_TIMEOUT", "30"))
+# Forms API requests allowed per minute across the app (Forms API quotas are per
+# minute); every request is charged, including pages and each request of a
+# batch. 0 disables the limit
+GOOGLE_API_CALLS_PER_MINUTE = float(os.getenv("GOOGLE_API_CALLS_PER_MINUTE", "300"))
+GOOGLE_API_BURST = float(os.getenv("GOOGLE_API_BURST", "10"))
+# Responses requested per responses().list page (the API allows up to 5000)
+GOOGLE_RESPONSES_PAGE_SIZE = int(os.getenv("GOOGLE_RESPONSES_PAGE_SIZE", "5000"))
+
+# Requests per batched HTTP call (Google allows up to 100)
+GOOGLE_BATCH_MAX_SIZE = int(os.getenv("GOOGLE_BATCH_MAX_SIZE", "50"))
+# Optional path to a Forms v1 discovery document; defaults to the copy bundled
+# with google-api-python-client, so building the service never hits the network
+GOOGLE_DISCOVERY_DOCUMENT = os.getenv("GOOGLE_DISCOVERY_DOCUMENT")
+
+# Form structure (question map) cache; after the ttl the revisionId is rechecked
+FORM_STRUCTURE_CACHE_SIZE = int(os.getenv("FORM_STRUCTURE_CACHE_SIZE", "256"))
+FORM_STRUCTURE_CACHE_TTL = float(os.getenv("FORM_STRUCTURE_CACHE_TTL", "300"))
+
+# Question title keywords for each lead field, tried in order
+LEAD_FIELD_KEYWORDS = {
+    "first_name": ['nome', 'name'],
+    "phone": ['telefone', 'phone', 'whatsapp'],
+    "email": ['email', 'e-mail'],
+}
+
+# Question spec types accepted by add_questions -> Forms API choiceQuestion types
+CHOICE_QUESTION_TYPES = {"choice": "RADIO", "checkbox": "CHECKBOX", "dropdown": "DROP_DOWN"}
+
+_google_executor = ThreadPoolExecutor(max_workers=GOOGLE_API_CONCURRENCY, thread_name_prefix="google-api")
+# Acquired by the worker threads right before each HTTP request they make
+_google_quota = BlockingTokenBucket(GOOGLE_API_CALLS_PER_MINUTE / 60, GOOGLE_API_BURST)
+
+
+async def run_google_call(func: Callable, *args, **kwargs):
+    """
+    Run a blocking Google API call on the Google thread pool
+
+    The event loop keeps serving other requests while the call runs. Each HTTP
+    request the call makes waits for the GOOGLE_API_CALLS_PER_MINUTE quota in
+    its thread (see GoogleFormsService._execute). Gives up after
+    GOOGLE_API_TIMEOUT; the worker thread itself is bounded by the
+    GOOGLE_HTTP_TIMEOUT socket timeout.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(
+            loop.run_in_executor(_google_executor, partial(func, *args, **kwargs)),
+            timeout=GOOGLE_API_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        raise Exception(f"Google API call timed out after {GOOGLE_API_TIMEOUT:.0f}s")
+
+
+_discovery_document: Optional[Dict[str, Any]] = None
+
+
+def get_discovery_document() -> Dict[str, Any]:
+    """Forms v1 discovery document, read and parsed once per process"""
+    global _discovery_document
+    if _discovery_document is None:
+        if GOOGLE_DISCOVERY_DOCUMENT:
+            with open(GOOGLE_DISCOVERY_DOCUMENT, 'r', encoding='utf-8') as f:
+                document = f.read()
+        else:
+            document = discovery_cache.get_static_doc('forms', 'v1')
+        if not document:
+            raise Exception("Google Forms discovery document not found")
+        _discovery_document = json.loads(document)
+    return _discovery_document
+
+
+def _timestamp_key(timestamp: str):
+    """Sort key for RFC3339 UTC timestamps whose fractional seconds vary in length"""
+    base, _, fraction = timestamp.rstrip('Z').partition('.')
+    return base, fraction.ljust(9, '0')
+
+
+def latest_submitted_time(responses: List[Dict[str, Any]], current: Optional[str] = None) -> Optional[str]:
+    """Return the newest last_submitted_time among processed responses (or current)"""
+    latest = current
+    for response in responses:
+        submitted = response.get('last_submitted_time')
+        if submitted and (latest is None or _timestamp_key(submitted) > _timestamp_key(latest)):
+            latest = submitted
+    return latest
+
+
+def build_field_mapping(question_titles, overrides: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Resolve which question fills which lead field
+    
+    Titles are matched against LEAD_FIELD_KEYWORDS (first matching field wins).
+    overrides maps a lead field to the exact question title to use instead of the
+    heuristic for that field.
+    
+    Returns:
+        Dict of question title -> lead field, in question order
+    """
+    mapping = {}
+    for title in question_titles:
+        title_lower = title.lower()
+        for field, keywords in LEAD_FIELD_KEYWORDS.items():
+            if any(keyword in title_lower for keyword in keywords):
+                mapping[title] = field
+                break
+    
+    if overrides:
+        overridden = {field for field, title in overrides.items() if title}
+        mapping = {title: field for title, field in mapping.items() if field not in overridden}
+        for field, title in overrides.items():
+            if title:
+                mapping[title] = field
+    
+    return mapping
+
 
 class GoogleFormsService:
     """Service for interacting with Google Forms API"""
@@ -18,45 +147,61 @@ class GoogleFormsService:
     def __init__(self):
         self.service = None
         self.credentials = None
+        self.credential_manager = GoogleCredentialManager(SCOPES)
+        self._auth_lock = threading.Lock()
+        # httplib2 is not thread-safe: each pool thread gets its own authorized Http
+        self._thread_local = threading.local()
+        # Form ID -> {"revision_id", "question_map"}
+        self._structure_cache = TTLCache("form_structure", FORM_STRUCTURE_CACHE_SIZE, FORM_STRUCTURE_CACHE_TTL)
+        # (form ID, revisionId, overrides) -> compiled question title -> lead field mapping
+        self._field_mapping_cache = TTLCache("field_mapping", FORM_STRUCTURE_CACHE_SIZE, 0)
         
+    def _http(self) -> AuthorizedHttp:
+        """Authorized Http for the current thread (reused across its calls)"""
+        http = getattr(self._thread_local, "http", None)
+        if http is None or http.credentials is not self.credentials:
+            http = AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=GOOGLE_HTTP_TIMEOUT))
+            self._thread_local.http = http
+        return http
+    
+    def _execute(self, request):
+        """Execute a Google API request with the current thread's Http and a fresh token"""
+        _google_quota.acquire()
+        self.credential_manager.ensure_fresh()
+        return request.execute(http=self._http())
+    
     async def authenticate(self, credentials_file: str = None, token_file: str = None):
         """
-        Authenticate with Google Forms API
+        Authenticate with Google Forms API (runs on the Google thread pool) and
+        start refreshing the token in the background
         
         Args:
             credentials_file: Path to credentials.json file
             token_file: Path to token.json file for stored credentials
         """
-        creds = None
-        
-        # Default file paths
-        if not credentials_file:
-            credentials_file = os.getenv("GOOGLE_CREDENTIALS_FILE", "credentials.json")
-        if not token_file:
-            token_file = os.getenv("GOOGLE_TOKEN_FILE", "token.json")
-        
-        # The file token.json stores the user's access and refresh tokens.
-        if os.path.exists(token_file):
-            creds = Credentials.from_authorized_user_file(token_file, SCOPES)
-        
-        # If there are no (valid) credentials available, let the user log in.
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                if not os.path.exists(credentials_file):
-                    raise Exception(f"Google credentials file not found: {credentials_file}")
-                
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    credentials_file, SCOPES)
-                creds = flow.run_local_server(port=0)
-            
-            # Save the credentials for the next run
-            with open(token_file, 'w') as token:
-                token.write(creds.to_json())
+        await run_google_call(self.authenticate_sync, credentials_file, token_file)
+        self.credential_manager.start_background_refresh()
+    
+    def authenticate_sync(self, credentials_file: str = None, token_file: str = None):
+        """
+        Authenticate with Google Forms API (blocking)
         
-        self.credentials = creds
-        self.service = build('forms', 'v1', credentials=creds)
+        Concurrent first calls share one authentication.
+        
+        Args:
+            credentials_file: Path to credentials.json file
+            token_file: Path to token.json file for stored credentials
+        """
+        with self._auth_lock:
+            if self.service:
+                return
+            
+            if credentials_file or token_file:
+                self.credential_manager = GoogleCredentialManager(SCOPES, credentials_file, token_file)
+            creds = self.credential_manager.load()
+            
+            self.credentials = creds
+            self.service = build_from_document(get_discovery_document(), credentials=creds)
         
     def create_form(self, title: str, description: str = "") -> Dict[str, Any]:
         """
@@ -81,7 +226,7 @@ class GoogleFormsService:
                 }
             }
             
-            result = self.service.forms().create(body=form).execute()
+            result = self._execute(self.service.forms().create(body=form))
             
             # Extract form information
             form_id = result.get('formId')
@@ -99,62 +244,100 @@ class GoogleFormsService:
             print(f'An error occurred creating form: {error}')
             raise Exception(f"Failed to create Google Form: {error}")
     
-    def add_text_question(self, form_id: str, question_text: str, required: bool = False) -> Dict[str, Any]:
+    @staticmethod
+    def _build_question_item(question: Dict[str, Any]) -> Dict[str, Any]:
+        """Build a Forms API item from a question spec (see add_questions)"""
+        question_type = question.get("type", "text")
+        body: Dict[str, Any] = {"required": question.get("required", False)}
+        
+        if question_type in ("text", "paragraph"):
+            body["textQuestion"] = {"paragraph": question_type == "paragraph"}
+        elif question_type in CHOICE_QUESTION_TYPES:
+            options = question.get("options") or []
+            if not options:
+                raise ValueError(f"Question '{question['text']}' of type {question_type} needs options")
+            body["choiceQuestion"] = {
+                "type": CHOICE_QUESTION_TYPES[question_type],
+                "options": [{"value": str(option)} for option in options]
+            }
+        else:
+            raise ValueError(f"Unsupported question type: {question_type}")
+        
+        return {"title": question["text"], "questionItem": {"question": body}}
+    
+    def add_questions(self, form_id: str, questions: List[Dict[str, Any]], start_index: int = 0) -> Dict[str, Any]:
         """
-        Add a text question to an existing form
+        Add several questions to a form in a single batchUpdate
         
         Args:
             form_id: Google Form ID
-            question_text: The question text
-            required: Whether the question is required
+            questions: Question specs in display order, each with "text" and optionally
+                "required" (default False), "type" ("text", "paragraph", "choice",
+                "checkbox" or "dropdown"; default "text") and "options" for choice types
+            start_index: Position of the first question; the rest follow in order
             
         Returns:
-            Dict containing question information
+            Dict containing the number of questions added and their item IDs
         """
         if not self.service:
             raise Exception("Google Forms service not authenticated. Call authenticate() first.")
+        if not questions:
+            return {'questions_added': 0, 'item_ids': []}
         
         try:
-            # Create the question
-            new_question = {
-                "requests": [{
+            requests = [
+                {
                     "createItem": {
-                        "item": {
-                            "title": question_text,
-                            "questionItem": {
-                                "question": {
-                                    "required": required,
-                                    "textQuestion": {
-                                        "paragraph": False
-                                    }
-                                }
-                            }
-                        },
-                        "location": {
-                            "index": 0
-                        }
+                        "item": self._build_question_item(question),
+                        "location": {"index": start_index + offset}
                     }
-                }]
-            }
+                }
+                for offset, question in enumerate(questions)
+            ]
             
-            # Add question to form
-            result = self.service.forms().batchUpdate(
-                formId=form_id, body=new_question).execute()
+            result = self._execute(self.service.forms().batchUpdate(
+                formId=form_id, body={"requests": requests}))
+            self._structure_cache.invalidate(form_id)
             
+            replies = result.get('replies', [])
             return {
-                'question_added': True,
-                'question_text': question_text,
-                'required': required
+                'questions_added': len(questions),
+                'item_ids': [reply.get('createItem', {}).get('itemId') for reply in replies]
             }
             
         except HttpError as error:
-            print(f'An error occurred adding question: {error}')
+            print(f'An error occurred adding questions: {error}')
+            raise Exception(f"Failed to add questions to form: {error}")
+    
+    def add_text_question(self, form_id: str, question_text: str, required: bool = False) -> Dict[str, Any]:
+        """
+        Add a text question to an existing form (at the top, as before)
+        
+        Args:
+            form_id: Google Form ID
+            question_text: The question text
+            required: Whether the question is required
+            
+        Returns:
+            Dict containing question information
+        """
+        try:
+            self.add_questions(form_id, [{"text": question_text, "required": required}])
+        except Exception as error:
             raise Exception(f"Failed to add question to form: {error}")
+        
+        return {
+            'question_added': True,
+            'question_text': question_text,
+            'required': required
+        }
     
     def create_lead_capture_form(self, title: str, description: str = "") -> Dict[str, Any]:
         """
         Create a standardized lead capture form with common fields
         
+        Two Google round trips: forms().create and one batchUpdate with every question.
+        
         Args:
             title: Form title
             description: Form description
@@ -167,7 +350,7 @@ class GoogleFormsService:
             form_info = self.create_form(title, description)
             form_id = form_info['form_id']
             
-            # Add standard lead capture questions
+            # Add standard lead capture questions, in display order
             questions = [
                 {"text": "Nome Completo", "required": True},
                 {"text": "Telefone (WhatsApp)", "required": True},
@@ -175,16 +358,11 @@ class GoogleFormsService:
                 {"text": "Como podemos ajudá-lo?", "required": False}
             ]
             
-            for question in questions:
-                self.add_text_question(
-                    form_id, 
-                    question["text"], 
-                    question["required"]
-                )
+            result = self.add_questions(form_id, questions)
             
             return {
                 **form_info,
-                'questions_added': len(questions),
+                'questions_added': result['questions_added'],
                 'standard_lead_form': True
             }
             
@@ -192,12 +370,113 @@ class GoogleFormsService:
             print(f'Error creating lead capture form: {error}')
             raise Exception(f"Failed to create lead capture form: {error}")
     
-    def get_form_responses(self, form_id: str) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _list_responses_params(form_id: str, since: Optional[str] = None,
+                               page_token: Optional[str] = None) -> Dict[str, Any]:
+        params = {"formId": form_id, "pageSize": GOOGLE_RESPONSES_PAGE_SIZE}
+        if since:
+            # ">=" so a response sharing the watermark's timestamp is never skipped;
+            # re-reading the newest already-synced response is harmless
+            params["filter"] = f"timestamp >= {since}"
+        if page_token:
+            params["pageToken"] = page_token
+        return params
+    
+    def list_raw_responses(self, form_id: str, since: Optional[str] = None,
+                           page_token: Optional[str] = None) -> List[Dict[str, Any]]:
         """
-        Get all responses for a form
+        Fetch raw responses of a form, following every nextPageToken
         
         Args:
             form_id: Google Form ID
+            since: Only return responses submitted at or after this RFC3339 timestamp
+            page_token: Start from this page instead of the first one
+            
+        Returns:
+            List of raw response resources
+        """
+        responses = []
+        while True:
+            params = self._list_responses_params(form_id, since, page_token)
+            result = self._execute(self.service.forms().responses().list(**params))
+            responses.extend(result.get('responses', []))
+            
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return responses
+    
+    def get_form_structure(self, form_id: str, question_ids: Optional[set] = None) -> Dict[str, Any]:
+        """
+        Get a form's revision_id and question ID -> title map, cached per form and revisionId
+        
+        Within FORM_STRUCTURE_CACHE_TTL the cached map is used without any request,
+        unless it lacks one of question_ids (maybe a question added since it was
+        cached). Otherwise only the revisionId is fetched; the full form is fetched
+        again only when the revision changed. An unchanged revision means unknown
+        ids belong to deleted questions, so the cached map is kept.
+        """
+        cached, fresh = self._structure_cache.get_entry(form_id)
+        if cached:
+            if fresh and (not question_ids or question_ids <= cached['question_map'].keys()):
+                self._structure_cache.record(hit=True)
+                return cached
+            
+            revision = self._execute(self.service.forms().get(formId=form_id, fields='revisionId'))
+            if revision.get('revisionId') == cached['revision_id']:
+                self._structure_cache.touch(form_id)
+                self._structure_cache.record(hit=True)
+                return cached
+        
+        self._structure_cache.record(hit=False)
+        form = self._execute(self.service.forms().get(formId=form_id))
+        return self._store_structure(form_id, form)
+    
+    def _store_structure(self, form_id: str, form: Dict[str, Any]) -> Dict[str, Any]:
+        """Build a form's structure from a forms().get result and cache it"""
+        # Create question mapping
+        question_map = {}
+        for item in form.get('items', []):
+            title = item.get('title', 'Unknown Question')
+            if 'questionItem' in item:
+                question_id = item['questionItem']['question']['questionId']
+                question_map[question_id] = title
+            elif 'questionGroupItem' in item:
+                # Each grid row is answered as its own question: "Grid title [Row title]"
+                for question in item['questionGroupItem'].get('questions', []):
+                    row_title = question.get('rowQuestion', {}).get('title', '')
+                    question_map[question['questionId']] = f"{title} [{row_title}]" if row_title else title
+        
+        structure = {"revision_id": form.get('revisionId'), "question_map": question_map}
+        self._structure_cache.set(form_id, structure)
+        return structure
+    
+    def get_question_map(self, form_id: str, question_ids: Optional[set] = None) -> Dict[str, str]:
+        """Get a form's question ID -> title map (see get_form_structure)"""
+        return self.get_form_structure(form_id, question_ids)['question_map']
+    
+    def get_field_mapping(self, form_id: str, overrides: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """
+        Get a form's question title -> lead field mapping, compiled once per revision
+        
+        Args:
+            form_id: Google Form ID
+            overrides: Lead field -> question title set by an admin (see build_field_mapping)
+        """
+        structure = self.get_form_structure(form_id)
+        key = (form_id, structure['revision_id'], tuple(sorted((overrides or {}).items())))
+        mapping = self._field_mapping_cache.get(key)
+        if mapping is None:
+            mapping = build_field_mapping(structure['question_map'].values(), overrides)
+            self._field_mapping_cache.set(key, mapping)
+        return mapping
+    
+    def get_form_responses(self, form_id: str, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get all responses for a form (every page)
+        
+        Args:
+            form_id: Google Form ID
+            since: Only return responses submitted at or after this RFC3339 timestamp
             
         Returns:
             List of form responses
@@ -207,93 +486,173 @@ class GoogleFormsService:
         
         try:
             # Get form responses
-            result = self.service.forms().responses().list(formId=form_id).execute()
-            responses = result.get('responses', [])
+            responses = self.list_raw_responses(form_id, since)
             
-            # Get form structure to map question IDs to question text
-            form = self.service.forms().get(formId=form_id).execute()
-            items = form.get('items', [])
+            return self._process_raw_responses(form_id, responses)
             
-            # Create question mapping
-            question_map = {}
-            for item in items:
-                if 'questionItem' in item:
-                    question_id = item['questionItem']['question']['questionId']
-                    question_title = item.get('title', 'Unknown Question')
-                    question_map[question_id] = question_title
+        except HttpError as error:
+            print(f'An error occurred getting responses: {error}')
+            raise Exception(f"Failed to get form responses: {error}")
+    
+    def _process_raw_responses(self, form_id: str, responses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Key raw responses' answers by question title"""
+        # Map question IDs to question text
+        answered_ids = {question_id for response in responses for question_id in response.get('answers', {})}
+        question_map = self.get_question_map(form_id, answered_ids) if responses else {}
+        
+        # Process responses
+        processed_responses = []
+        for response in responses:
+            response_data = {
+                'response_id': response.get('responseId'),
+                'create_time': response.get('createTime'),
+                'last_submitted_time': response.get('lastSubmittedTime'),
+                'answers': {}
+            }
             
-            # Process responses
-            processed_responses = []
-            for response in responses:
-                response_data = {
-                    'response_id': response.get('responseId'),
-                    'create_time': response.get('createTime'),
-                    'last_submitted_time': response.get('lastSubmittedTime'),
-                    'answers': {}
-                }
-                
-                # Process answers
-                answers = response.get('answers', {})
-                for question_id, answer_data in answers.items():
-                    question_title = question_map.get(question_id, question_id)
-                    
-                    # Extract text answers
-                    text_answers = answer_data.get('textAnswers', {})
-                    if text_answers and 'answers' in text_answers:
-                        answer_values = [ans.get('value', '') for ans in text_answers['answers']]
-                        response_data['answers'][question_title] = answer_values[0] if len(answer_values) == 1 else answer_values
+            # Process answers
+            answers = response.get('answers', {})
+            for question_id, answer_data in answers.items():
+                question_title = question_map.get(question_id, question_id)
                 
-                processed_responses.append(response_data)
+                # Extract text answers
+                text_answers = answer_data.get('textAnswers', {})
+                if text_answers and 'answers' in text_answers:
+                    answer_values = [ans.get('value', '') for ans in text_answers['answers']]
+                    response_data['answers'][question_title] = answer_values[0] if len(answer_values) == 1 else answer_values
             
-            return processed_responses
+            processed_responses.append(response_data)
+        
+        return processed_responses
+    
+    def batch_execute(self, requests: Dict[str, Any]) -> Dict[str, Tuple[Optional[Dict[str, Any]], Optional[Exception]]]:
+        """
+        Execute several API requests in batched HTTP round trips
+        
+        Args:
+            requests: Request ID -> API request (e.g. forms().get(...))
             
-        except HttpError as error:
-            print(f'An error occurred getting responses: {error}')
-            raise Exception(f"Failed to get form responses: {error}")
+        Returns:
+            Request ID -> (result, None) or (None, error); one failing request
+            does not affect the others
+        """
+        results: Dict[str, Tuple[Optional[Dict[str, Any]], Optional[Exception]]] = {}
+        
+        def callback(request_id, response, exception):
+            results[request_id] = (response, exception)
+        
+        items = list(requests.items())
+        for start in range(0, len(items), GOOGLE_BATCH_MAX_SIZE):
+            batch = self.service.new_batch_http_request(callback=callback)
+            chunk = items[start:start + GOOGLE_BATCH_MAX_SIZE]
+            for request_id, request in chunk:
+                batch.add(request, request_id=request_id)
+            try:
+                # Every request of the batch counts against the quota
+                _google_quota.acquire(len(chunk))
+                self.credential_manager.ensure_fresh()
+                batch.execute(http=self._http())
+            except Exception as error:
+                # The whole round trip failed: report it for every request of the chunk
+                for request_id, _ in chunk:
+                    results.setdefault(request_id, (None, error))
+        
+        return results
     
-    def process_responses_to_leads(self, form_id: str, responses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def get_many_form_responses(self, since_by_form: Dict[str, Optional[str]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get responses of several forms, batching their first round of requests
+        
+        One batch carries, for every form, the first responses().list page plus a
+        forms().get when its structure is not freshly cached. Only forms with more
+        pages need further (individual) requests.
+        
+        Args:
+            since_by_form: Google Form ID -> only fetch responses submitted at or after this timestamp
+            
+        Returns:
+            Google Form ID -> {"responses": [...], "error": None} or {"responses": [], "error": "..."}
+        """
+        if not self.service:
+            raise Exception("Google Forms service not authenticated. Call authenticate() first.")
+        
+        requests = {}
+        for form_id, since in since_by_form.items():
+            requests[f"responses:{form_id}"] = self.service.forms().responses().list(
+                **self._list_responses_params(form_id, since))
+            cached, fresh = self._structure_cache.get_entry(form_id)
+            if not (cached and fresh):
+                requests[f"form:{form_id}"] = self.service.forms().get(formId=form_id)
+        
+        batch_results = self.batch_execute(requests)
+        
+        results = {}
+        for form_id, since in since_by_form.items():
+            try:
+                form, error = batch_results.get(f"form:{form_id}", (None, None))
+                if error:
+                    raise error
+                if form:
+                    self._structure_cache.record(hit=False)
+                    self._store_structure(form_id, form)
+                
+                page, error = batch_results.get(f"responses:{form_id}", (None, None))
+                if error:
+                    raise error
+                responses = page.get('responses', [])
+                if page.get('nextPageToken'):
+                    responses.extend(self.list_raw_responses(form_id, since, page['nextPageToken']))
+                
+                results[form_id] = {"responses": self._process_raw_responses(form_id, responses), "error": None}
+            except Exception as error:
+                print(f'An error occurred getting responses of form {form_id}: {error}')
+                results[form_id] = {"responses": [], "error": f"Failed to get form responses: {error}"}
+        
+        return results
+    
+    def process_responses_to_leads(self, form_id: str, responses: List[Dict[str, Any]],
+                                   field_mapping: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
         """
         Process Google Form responses into lead data structure
         
         Args:
-            form_id: Google Form ID
+            form_id: Database form ID the leads belong to
             responses: List of form responses
+            field_mapping: Question title -> lead field (see get_field_mapping); when
+                omitted it is built from the question titles found in the responses
             
         Returns:
-            List of lead data dictionaries ready for database insertion
+            List of lead data dictionaries ready for database insertion (keyed by response_id)
         """
+        if field_mapping is None:
+            titles = dict.fromkeys(title for response in responses for title in response.get('answers', {}))
+            field_mapping = build_field_mapping(titles)
+        
         leads = []
         
         for response in responses:
             answers = response.get('answers', {})
             
-            # Extract standard fields (flexible matching)
-            first_name = ""
-            phone = ""
-            email = ""
-            
-            # Try to match common field patterns
-            for question, answer in answers.items():
-                question_lower = question.lower()
-                
-                if any(keyword in question_lower for keyword in ['nome', 'name']):
-                    first_name = str(answer) if answer else ""
-                elif any(keyword in question_lower for keyword in ['telefone', 'phone', 'whatsapp']):
-                    phone = str(answer) if answer else ""
-                elif any(keyword in question_lower for keyword in ['email', 'e-mail']):
-                    email = str(answer) if answer else ""
+            # Extract standard fields
+            fields = {}
+            for question, field in field_mapping.items():
+                if question in answers:
+                    answer = answers[question]
+                    fields[field] = str(answer) if answer else ""
             
             # Only create lead if we have minimum required data
-            if first_name and phone:
+            if fields.get('first_name') and fields.get('phone'):
                 lead_data = {
                     'form_id': form_id,
-                    'first_name': first_name,
-                    'phone': phone,
+                    'response_id': response.get('response_id'),
+                    'first_name': fields['first_name'],
+                    'phone': fields['phone'],
                     'responses': answers
                 }
                 
-                if email:
-                    lead_data['email'] = email
+                for optional_field in ('last_name', 'email'):
+                    if fields.get(optional_field):
+                        lead_data[optional_field] = fields[optional_field]
                 
                 leads.append(lead_data)
         
@@ -305,40 +664,115 @@ google_forms_service = GoogleFormsService()
 
 
 # Helper functions for easy use
+def get_google_cache_stats() -> List[Dict[str, Any]]:
+    """Hit/miss statistics of the form structure and field mapping caches"""
+    return [
+        google_forms_service._structure_cache.stats(),
+        google_forms_service._field_mapping_cache.stats()
+    ]
+
+
+async def warm_up_google_forms_service():
+    """
+    Parse the discovery document and, when a token file exists, authenticate
+    and build the Forms service (application startup)
+    
+    Never runs the interactive login flow and never fails startup: without a
+    token the service is still built lazily by the first Google-backed request.
+    """
+    try:
+        await asyncio.to_thread(get_discovery_document)
+        if os.path.exists(google_forms_service.credential_manager.token_file):
+            await google_forms_service.authenticate()
+            print("Google Forms service ready")
+    except Exception as e:
+        print(f"Google Forms warm-up skipped: {e}")
+
+
+async def close_google_forms_service():
+    """Stop the background token refresh (application shutdown)"""
+    await google_forms_service.credential_manager.stop_background_refresh()
+
+
 async def create_google_form(title: str, description: str = "") -> Dict[str, Any]:
     """Create a Google Form with authentication check"""
     try:
         if not google_forms_service.service:
             await google_forms_service.authenticate()
         
-        return google_forms_service.create_lead_capture_form(title, description)
+        return await run_google_call(google_forms_service.create_lead_capture_form, title, description)
     except Exception as e:
         print(f"Error creating Google Form: {e}")
         raise Exception(f"Failed to create Google Form: {str(e)}")
 
 
-async def get_google_form_responses(form_id: str) -> List[Dict[str, Any]]:
-    """Get responses from a Google Form"""
+async def get_google_form_responses(form_id: str, since: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Get responses from a Google Form (optionally only those submitted since a timestamp)"""
     try:
         if not google_forms_service.service:
             await google_forms_service.authenticate()
         
-        return google_forms_service.get_form_responses(form_id)
+        return await run_google_call(google_forms_service.get_form_responses, form_id, since)
     except Exception as e:
         print(f"Error getting form responses: {e}")
         raise Exception(f"Failed to get form responses: {str(e)}")
 
 
-async def sync_form_responses_to_leads(form_id: str) -> List[Dict[str, Any]]:
-    """Sync Google Form responses to lead database entries"""
+async def get_google_forms_responses_batch(since_by_form: Dict[str, Optional[str]]) -> Dict[str, Dict[str, Any]]:
+    """Get responses of several Google Forms with batched requests (errors are per form)"""
+    try:
+        if not google_forms_service.service:
+            await google_forms_service.authenticate()
+        
+        return await run_google_call(google_forms_service.get_many_form_responses, since_by_form)
+    except Exception as e:
+        print(f"Error getting responses of {len(since_by_form)} forms: {e}")
+        raise Exception(f"Failed to get form responses: {str(e)}")
+
+
+async def get_google_form_field_mapping(form_id: str, overrides: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Get the question title -> lead field mapping of a Google Form"""
     try:
-        # Get responses from Google Forms
-        responses = await get_google_form_responses(form_id)
+        if not google_forms_service.service:
+            await google_forms_service.authenticate()
+        
+        return await run_google_call(google_forms_service.get_field_mapping, form_id, overrides)
+    except Exception as e:
+        print(f"Error getting form field mapping: {e}")
+        raise Exception(f"Failed to get form field mapping: {str(e)}")
+
+
+async def sync_form_responses_to_leads(google_form_id: str, form_id: Optional[str] = None,
+                                      since: Optional[str] = None,
+                                      field_overrides: Optional[Dict[str, str]] = None,
+                                      responses: Optional[List[Dict[str, Any]]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Fetch Google Form responses and map them to lead database entries
+    
+    Args:
+        google_form_id: Google Form ID
+        form_id: Database form ID stored on the leads (defaults to google_form_id)
+        since: Only fetch responses submitted at or after this RFC3339 timestamp
+        field_overrides: Admin lead field -> question title overrides
+        responses: Responses already fetched (e.g. by a batch); skips the fetch
+        
+    Returns:
+        Tuple of (lead dicts, newest lastSubmittedTime among the fetched responses)
+    """
+    try:
+        # Get new responses from Google Forms
+        if responses is None:
+            responses = await get_google_form_responses(google_form_id, since)
+        if not responses:
+            return [], since
+        
+        # Question -> lead field mapping, compiled once per form revision
+        field_mapping = await get_google_form_field_mapping(google_form_id, field_overrides)
         
         # Process responses into lead format
-        leads_data = google_forms_service.process_responses_to_leads(form_id, responses)
+        leads_data = google_forms_service.process_responses_to_leads(form_id or google_form_id, responses, field_mapping)
         
-        return leads_data
+        return leads_data, latest_submitted_time(responses, since)
     except Exception as e:
         print(f"Error syncing form responses: {e}")
-        raise Exception(f"Failed to sync form responses: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Failed to sync form responses: {str(e)}")
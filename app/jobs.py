@@ -0,0 +1,200 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timezone
+from uuid import uuid4
+from typing import Dict, List, Optional, Any, Awaitable, Callable
+
+# Finished jobs kept in memory for GET /jobs/{id}
+JOBS_MAX_HISTORY = int(os.getenv("JOBS_MAX_HISTORY", "200"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_PAUSED = "paused"
+JOB_CANCELLED = "cancelled"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+FINISHED_STATUSES = (JOB_CANCELLED, JOB_COMPLETED, JOB_FAILED)
+
+
+class CampaignJob:
+    """In-process state of a background send campaign"""
+
+    def __init__(self, kind: str, total: int, metadata: Optional[Dict[str, Any]] = None):
+        self.id = str(uuid4())
+        self.kind = kind
+        self.total = total
+        self.metadata = metadata or {}
+        self.status = JOB_QUEUED
+        self.sent = 0
+        self.failed = 0
+        self.error: Optional[str] = None
+        # Set while sends are held back, e.g. by an open circuit breaker
+        self.blocked_reason: Optional[str] = None
+        self.successful_results: List[dict] = []
+        self.failed_results: List[dict] = []
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        self._cancel_requested = False
+        self._active_since: Optional[float] = None
+        self._active_seconds = 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_requested
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def _start_clock(self):
+        if self._active_since is None:
+            self._active_since = time.monotonic()
+
+    def _stop_clock(self):
+        if self._active_since is not None:
+            self._active_seconds += time.monotonic() - self._active_since
+            self._active_since = None
+
+    def record(self, sent: bool, result: Dict[str, Any]):
+        """Record the outcome of one recipient"""
+        if sent:
+            self.sent += 1
+            self.successful_results.append(result)
+        else:
+            self.failed += 1
+            self.failed_results.append(result)
+
+    async def wait_if_paused(self):
+        """Block a send worker while the job is paused"""
+        await self._resumed.wait()
+
+    def pause(self) -> bool:
+        if self.status not in (JOB_QUEUED, JOB_RUNNING):
+            return False
+        self._resumed.clear()
+        self._stop_clock()
+        self.status = JOB_PAUSED
+        return True
+
+    def resume(self) -> bool:
+        if self.status != JOB_PAUSED:
+            return False
+        self.status = JOB_RUNNING if self.started_at else JOB_QUEUED
+        if self.started_at:
+            self._start_clock()
+        self._resumed.set()
+        return True
+
+    def cancel(self) -> bool:
+        """Stop handing out new recipients; in-flight sends finish normally"""
+        if self.finished:
+            return False
+        self._cancel_requested = True
+        # Paused workers must wake up to notice the cancellation
+        self._resumed.set()
+        return True
+
+    def rate(self) -> float:
+        """Messages processed per second of active (non-paused) running time"""
+        active = self._active_seconds
+        if self._active_since is not None:
+            active += time.monotonic() - self._active_since
+        return round((self.sent + self.failed) / active, 2) if active > 0 else 0.0
+
+    def to_dict(self, include_results: bool = False) -> Dict[str, Any]:
+        processed = self.sent + self.failed
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            **self.metadata,
+            "counts": {
+                "total": self.total,
+                "queued": 0 if self.finished else self.total - processed,
+                "sent": self.sent,
+                "failed": self.failed,
+                "skipped": self.total - processed if self.finished else 0
+            },
+            "rate_per_second": self.rate(),
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+        if self.blocked_reason and not self.finished:
+            data["blocked_reason"] = self.blocked_reason
+        if self.error:
+            data["error"] = self.error
+        if include_results:
+            data["results"] = {
+                "successful": self.successful_results,
+                "failed": self.failed_results
+            }
+        return data
+
+
+# Jobs by id, oldest first
+_jobs: "OrderedDict[str, CampaignJob]" = OrderedDict()
+
+
+def _prune_jobs():
+    """Forget the oldest finished jobs beyond JOBS_MAX_HISTORY"""
+    finished = [job_id for job_id, job in _jobs.items() if job.finished]
+    for job_id in finished[:max(len(finished) - JOBS_MAX_HISTORY, 0)]:
+        del _jobs[job_id]
+
+
+def get_job(job_id: str) -> Optional[CampaignJob]:
+    return _jobs.get(job_id)
+
+
+def list_jobs() -> List[CampaignJob]:
+    return list(reversed(_jobs.values()))
+
+
+def start_job(job: CampaignJob, run: Callable[[CampaignJob], Awaitable[Any]]) -> CampaignJob:
+    """
+    Register a job and run it in the background
+
+    Args:
+        job: The job to start
+        run: Coroutine function doing the work; it receives the job to report progress
+    """
+    async def runner():
+        await job.wait_if_paused()
+        job.started_at = datetime.now(timezone.utc)
+        if job.status == JOB_QUEUED:
+            job.status = JOB_RUNNING
+        job._start_clock()
+        try:
+            await run(job)
+            job.status = JOB_CANCELLED if job.cancelled else JOB_COMPLETED
+        except asyncio.CancelledError:
+            job.status = JOB_CANCELLED
+            raise
+        except Exception as e:
+            print(f"Error in job {job.id}: {e}")
+            job.status = JOB_FAILED
+            job.error = str(e)
+        finally:
+            job._stop_clock()
+            job.finished_at = datetime.now(timezone.utc)
+            _prune_jobs()
+
+    _jobs[job.id] = job
+    job.task = asyncio.create_task(runner())
+    return job
+
+
+async def shutdown_jobs():
+    """Cancel running jobs on application shutdown"""
+    tasks = [job.task for job in _jobs.values() if job.task and not job.task.done()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
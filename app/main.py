@@ -1,35 +1,53 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
-from typing import List
-from uuid import UUID
+from fastapi.responses import JSONResponse, StreamingResponse
+from functools import partial
+from typing import List, Optional, Literal
+from uuid import UUID, uuid4
+from datetime import datetime, date
 import pandas as pd
 import io
+import json
 import httpx
 from pydantic import BaseModel
 
 from app.models import (
     UserCreate, UserResponse,
-    FormCreate, FormResponse,
+    FormCreate, FormResponse, FormFieldMapping,
     LeadCreate, LeadResponse,
     SendLeadMessagesRequest, SendFormLeadMessagesRequest
 )
+from app.csv_import import (
+    CSV_READ_OPTIONS, CSV_IMPORT_CHUNK_SIZE, MissingColumnsError,
+    missing_required_columns, validate_users_dataframe, import_users, stream_import_users
+)
 from app.database import (
-    get_all_users, create_user,
-    get_all_forms, get_form_by_id, create_form,
-    get_all_leads, get_leads_by_form_id, get_leads_by_ids, create_lead
+    get_all_users, get_users_page,
+    get_all_forms, get_google_linked_forms, get_form_by_id, create_form, update_form,
+    get_all_leads, get_leads_page, get_leads_by_form_id, get_leads_by_ids, create_lead,
+    init_http_client, close_http_client, get_form_cache_stats, get_coalesce_stats,
+    iter_pages, decode_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE,
+    USER_COLUMNS, LEAD_COLUMNS, parse_select, build_filters, count_rows,
+    get_forms_with_lead_counts, get_recent_leads_activity, get_form_daily_lead_volume, RECENT_LEADS_MAX
+)
+from app.messaging import (
+    init_evolution_client, close_evolution_client,
+    normalize_phone_number, send_text_message, send_text_messages, get_circuit_states
+)
+from app.resilience import CircuitOpenError
+from app.jobs import CampaignJob, start_job, get_job, list_jobs, shutdown_jobs
+from app.outbox_worker import enqueue_campaign, get_campaign_status
+from app.form_sync import sync_form
+from app.google_forms import (
+    get_google_form_field_mapping, get_google_cache_stats,
+    warm_up_google_forms_service, close_google_forms_service
+)
+from app.sync_scheduler import (
+    FORM_SYNC_SCHEDULER_ENABLED, start_form_sync_scheduler, stop_form_sync_scheduler,
+    sync_all_forms, get_scheduler_status
 )
-
-# Evolution API Configuration
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-EVOLUTION_URL = os.getenv("EVOLUTION_URL", "https://evolution-victor.namastex.ai")
-EVOLUTION_INSTANCE_NAME = os.getenv("EVOLUTION_INSTANCE_NAME", "CDLVilaVelha")
-EVOLUTION_API_KEY = os.getenv("EVOLUTION_API_KEY")
 
 # Pydantic models for messaging
 class SendTextMessageRequest(BaseModel):
@@ -40,11 +58,27 @@ class SendBulkTextMessageRequest(BaseModel):
     numbers: List[str]
     text: str
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared HTTP connection pools and warm up Google on startup; close them on shutdown"""
+    await init_http_client()
+    await init_evolution_client()
+    await warm_up_google_forms_service()
+    if FORM_SYNC_SCHEDULER_ENABLED:
+        start_form_sync_scheduler()
+    yield
+    await stop_form_sync_scheduler()
+    await close_google_forms_service()
+    await shutdown_jobs()
+    await close_evolution_client()
+    await close_http_client()
+
 # Create FastAPI app
 app = FastAPI(
     title="CDL Jovem Vila Velha API",
     description="API for CDL Jovem Vila Velha WhatsApp Campaign System",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -54,6 +88,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Browsers only let cross-origin clients read listed response headers
+    expose_headers=["X-Next-Cursor"],
 )
 
 @app.exception_handler(RequestValidationError)
@@ -76,76 +112,152 @@ async def health_check():
         "version": "2.0.0"
     }
 
+def stream_ndjson(fetch_page, limit: Optional[int], cursor: Optional[str]) -> StreamingResponse:
+    """Stream every page from fetch_page to the client as newline-delimited JSON"""
+    async def generate():
+        async for rows in iter_pages(fetch_page, limit or DEFAULT_PAGE_SIZE, cursor):
+            yield "".join(json.dumps(row) + "\n" for row in rows)
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+async def list_with_pagination(response: Response, fetch_page, fetch_all,
+                               limit: Optional[int], cursor: Optional[str], stream: bool,
+                               raw: bool = False):
+    """
+    Shared handler for list endpoints
+
+    - stream=true: NDJSON stream of all rows, fetched page by page
+    - limit/cursor: a single keyset page, next cursor in the X-Next-Cursor header
+    - neither: the full list (legacy behaviour)
+
+    raw=true returns rows as fetched, bypassing the response model (used for
+    projected rows that lack some of the model's fields).
+    """
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if stream:
+        return stream_ndjson(fetch_page, limit, cursor)
+
+    if limit or cursor:
+        try:
+            rows, next_cursor = await fetch_page(limit or DEFAULT_PAGE_SIZE, cursor)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Error fetching page: {str(e)}")
+        if raw:
+            return JSONResponse(content=rows, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return rows
+
+    rows = await fetch_all()
+    return JSONResponse(content=rows) if raw else rows
+
+
+def parse_list_query(fields: Optional[str], allowed_columns, **filter_values):
+    """Validate ?fields= and build the filters of a list endpoint; returns (select, filters)"""
+    try:
+        select = parse_select(fields, allowed_columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = build_filters(**{
+        name: value.isoformat() if isinstance(value, datetime) else value
+        for name, value in filter_values.items()
+    })
+    return select, filters
+
+
+async def count_or_502(table: str, filters, mode: str):
+    """Row count for a count endpoint; the rows themselves are never downloaded"""
+    total = await count_rows(table, filters, mode)
+    if total is None:
+        raise HTTPException(status_code=502, detail=f"Error counting {table}")
+    return {"count": total, "mode": mode}
+
+
 @app.get("/users", response_model=List[UserResponse])
-async def get_users():
-    """Get all users from database"""
-    users = await get_all_users()
-    return users
+async def get_users(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size for keyset pagination"),
+    cursor: Optional[str] = Query(None, description="Cursor from a previous X-Next-Cursor header"),
+    stream: bool = Query(False, description="Stream all users as NDJSON"),
+    fields: Optional[str] = Query(None, description="Comma separated columns to return (e.g. id,phone)"),
+    phone: Optional[str] = Query(None),
+    email: Optional[str] = Query(None),
+    created_after: Optional[datetime] = Query(None, description="Created at or after (inclusive)"),
+    created_before: Optional[datetime] = Query(None, description="Created before (exclusive)")
+):
+    """Get users from database (full list, one keyset page, or an NDJSON stream)"""
+    select, filters = parse_list_query(
+        fields, USER_COLUMNS,
+        phone=phone, email=email, created_after=created_after, created_before=created_before
+    )
+    return await list_with_pagination(
+        response,
+        partial(get_users_page, select=select, filters=filters),
+        partial(get_all_users, select, filters),
+        limit, cursor, stream, raw=bool(select)
+    )
+
+@app.get("/users/count")
+async def count_users(
+    mode: Literal["exact", "planned", "estimated"] = Query("exact", description="PostgREST count strategy"),
+    phone: Optional[str] = Query(None),
+    email: Optional[str] = Query(None),
+    created_after: Optional[datetime] = Query(None, description="Created at or after (inclusive)"),
+    created_before: Optional[datetime] = Query(None, description="Created before (exclusive)")
+):
+    """Count users (optionally filtered); planned/estimated avoid a full count on large tables"""
+    _, filters = parse_list_query(
+        None, USER_COLUMNS,
+        phone=phone, email=email, created_after=created_after, created_before=created_before
+    )
+    return await count_or_502("users", filters, mode)
 
 @app.post("/users/upload-csv", status_code=201)
-async def upload_users_csv(file: UploadFile = File(...)):
-    """Upload CSV file with users data and save to database"""
+async def upload_users_csv(
+    file: UploadFile = File(...),
+    chunk_size: Optional[int] = Query(None, ge=1, le=5000, description="Users per bulk insert request"),
+    stream: bool = Query(False, description="Import in bounded-memory chunks, skipping invalid rows")
+):
+    """
+    Upload CSV file with users data and save to database
+    
+    By default the whole file is validated first and rejected if any row is invalid.
+    With stream=true the file is parsed, validated and inserted chunk by chunk;
+    invalid rows are skipped and listed in the response.
+    """
     
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be a CSV")
     
     try:
+        if stream:
+            try:
+                return await stream_import_users(
+                    file.file, insert_chunk_size=chunk_size or CSV_IMPORT_CHUNK_SIZE
+                )
+            except MissingColumnsError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        
         content = await file.read()
         csv_string = content.decode('utf-8')
-        df = pd.read_csv(io.StringIO(csv_string))
+        df = pd.read_csv(io.StringIO(csv_string), **CSV_READ_OPTIONS)
         
         # Validate required columns
-        required_columns = ['first_name', 'phone']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = missing_required_columns(df)
         if missing_columns:
             raise HTTPException(
                 status_code=400, 
                 detail=f"Missing required columns: {missing_columns}"
             )
         
-        # Optional columns
-        optional_columns = ['last_name', 'age', 'email', 'street_address', 'city', 'state', 'postal_code', 'country']
-        
-        users_data = []
-        errors = []
-        
-        for index, row in df.iterrows():
-            try:
-                user_data = {
-                    'first_name': str(row['first_name']).strip(),
-                    'phone': str(row['phone']).strip()
-                }
-                
-                if not user_data['first_name'] or not user_data['phone']:
-                    errors.append(f"Row {index + 1}: first_name and phone cannot be empty")
-                    continue
-                
-                # Add optional fields
-                for col in optional_columns:
-                    if col in df.columns and pd.notna(row[col]) and str(row[col]).strip():
-                        if col == 'age':
-                            try:
-                                age_value = int(row[col])
-                                if age_value <= 0:
-                                    errors.append(f"Row {index + 1}: Age must be greater than 0")
-                                    continue
-                                user_data[col] = age_value
-                            except ValueError:
-                                errors.append(f"Row {index + 1}: Age must be a valid number")
-                                continue
-                        elif col == 'email':
-                            email_value = str(row[col]).strip()
-                            if '@' not in email_value:
-                                errors.append(f"Row {index + 1}: Invalid email format")
-                                continue
-                            user_data[col] = email_value
-                        else:
-                            user_data[col] = str(row[col]).strip()
-                    
-                users_data.append(user_data)
-                
-            except Exception as e:
-                errors.append(f"Row {index + 1}: Error processing data - {str(e)}")
+        # Column-wise validation of required fields, age and email
+        users_data, errors, row_numbers = validate_users_dataframe(df)
         
         if errors:
             raise HTTPException(
@@ -159,24 +271,14 @@ async def upload_users_csv(file: UploadFile = File(...)):
             )
         
         if users_data:
-            created_users = []
-            failed_users = []
-            
-            for i, user_data in enumerate(users_data):
-                try:
-                    created_user = await create_user(user_data)
-                    if created_user:
-                        created_users.extend(created_user)
-                except Exception as e:
-                    error_message = str(e)
-                    if "já existe" in error_message:
-                        failed_users.append(f"Line {i + 1}: {error_message}")
-                    else:
-                        failed_users.append(f"Line {i + 1}: Error creating user - {error_message}")
+            # Chunked bulk inserts; duplicate phones become warnings
+            import_result = await import_users(users_data, chunk_size or CSV_IMPORT_CHUNK_SIZE, row_numbers)
+            imported_count = import_result["imported_count"]
+            failed_users = import_result["warnings"]
             
             result = {
-                "message": f"Import completed: {len(created_users)} contacts added",
-                "imported_count": len(created_users),
+                "message": f"Import completed: {imported_count} contacts added",
+                "imported_count": imported_count,
                 "total_rows": len(df)
             }
             
@@ -188,6 +290,8 @@ async def upload_users_csv(file: UploadFile = File(...)):
         else:
             raise HTTPException(status_code=400, detail="No valid users found in CSV")
             
+    except HTTPException:
+        raise  # Re-raise HTTP exceptions as-is
     except pd.errors.EmptyDataError:
         raise HTTPException(status_code=400, detail="CSV file is empty")
     except pd.errors.ParserError as e:
@@ -242,15 +346,123 @@ async def get_form(form_id: UUID):
 
 
 @app.get("/forms/{form_id}/leads", response_model=List[LeadResponse])
-async def get_form_leads(form_id: UUID):
-    """Get all leads for a specific form"""
+async def get_form_leads(
+    form_id: UUID,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size for keyset pagination"),
+    cursor: Optional[str] = Query(None, description="Cursor from a previous X-Next-Cursor header"),
+    stream: bool = Query(False, description="Stream all leads of the form as NDJSON"),
+    fields: Optional[str] = Query(None, description="Comma separated columns to return (e.g. id,phone)"),
+    phone: Optional[str] = Query(None),
+    email: Optional[str] = Query(None),
+    created_after: Optional[datetime] = Query(None, description="Created at or after (inclusive)"),
+    created_before: Optional[datetime] = Query(None, description="Created before (exclusive)")
+):
+    """Get leads for a specific form (full list, one keyset page, or an NDJSON stream)"""
+    select, filters = parse_list_query(
+        fields, LEAD_COLUMNS,
+        phone=phone, email=email, created_after=created_after, created_before=created_before
+    )
+    
     # First check if form exists
     form = await get_form_by_id(form_id)
     if not form:
         raise HTTPException(status_code=404, detail="Form not found")
     
-    leads = await get_leads_by_form_id(form_id)
-    return leads
+    return await list_with_pagination(
+        response,
+        partial(get_leads_page, form_id=form_id, select=select, filters=filters),
+        partial(get_leads_by_form_id, form_id, select, filters),
+        limit, cursor, stream, raw=bool(select)
+    )
+
+
+@app.get("/forms/{form_id}/field-mapping")
+async def get_form_field_mapping(form_id: UUID):
+    """Get the form's field mapping overrides and the question -> lead field mapping in effect"""
+    form = await get_form_by_id(form_id)
+    if not form:
+        raise HTTPException(status_code=404, detail="Form not found")
+    
+    overrides = form.get('field_mapping') or {}
+    if not form.get('google_form_id'):
+        return {"overrides": overrides, "mapping": None}
+    
+    try:
+        mapping = await get_google_form_field_mapping(form['google_form_id'], overrides or None)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error resolving field mapping: {str(e)}")
+    return {"overrides": overrides, "mapping": mapping}
+
+
+@app.put("/forms/{form_id}/field-mapping", response_model=FormResponse)
+async def set_form_field_mapping(form_id: UUID, field_mapping: FormFieldMapping):
+    """Override which question fills each lead field (omitted fields keep the heuristics)"""
+    form = await get_form_by_id(form_id)
+    if not form:
+        raise HTTPException(status_code=404, detail="Form not found")
+    
+    try:
+        return await update_form(form_id, {"field_mapping": field_mapping.model_dump(exclude_none=True)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating field mapping: {str(e)}")
+
+
+@app.post("/forms/{form_id}/sync", status_code=200)
+async def sync_form_leads(
+    form_id: UUID,
+    full: bool = Query(False, description="Fetch every response instead of only those since the last sync")
+):
+    """Pull the form's Google Forms responses into leads (idempotent upsert by response ID)"""
+    form = await get_form_by_id(form_id)
+    if not form:
+        raise HTTPException(status_code=404, detail="Form not found")
+    
+    try:
+        return await sync_form(form, full=full)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error syncing form: {str(e)}")
+
+
+# Form columns reported by GET /sync/forms
+FORM_SYNC_STATUS_FIELDS = (
+    "id", "title", "google_form_id", "last_synced_at", "last_response_submitted_at",
+    "last_sync_duration_seconds", "last_sync_fetched_count", "last_sync_upserted_count", "last_sync_error"
+)
+
+
+@app.get("/sync/forms")
+async def get_forms_sync_status():
+    """Scheduler state and the last sync of every Google-linked form"""
+    try:
+        forms = await get_google_linked_forms()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting forms: {str(e)}")
+    
+    return {
+        "scheduler": get_scheduler_status(),
+        "forms": [{field: form.get(field) for field in FORM_SYNC_STATUS_FIELDS} for form in forms]
+    }
+
+
+@app.post("/sync/forms", status_code=200)
+async def sync_all_forms_now():
+    """Sync every Google-linked form now (same pass the scheduler runs)"""
+    try:
+        return await sync_all_forms()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error syncing forms: {str(e)}")
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss statistics of the in-process caches and of read coalescing"""
+    return {
+        "caches": [get_form_cache_stats(), *get_google_cache_stats()],
+        "coalescing": get_coalesce_stats()
+    }
 
 
 # ========================
@@ -258,10 +470,46 @@ async def get_form_leads(form_id: UUID):
 # ========================
 
 @app.get("/leads", response_model=List[LeadResponse])
-async def get_leads():
-    """Get all leads from database"""
-    leads = await get_all_leads()
-    return leads
+async def get_leads(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size for keyset pagination"),
+    cursor: Optional[str] = Query(None, description="Cursor from a previous X-Next-Cursor header"),
+    stream: bool = Query(False, description="Stream all leads as NDJSON"),
+    fields: Optional[str] = Query(None, description="Comma separated columns to return (e.g. id,phone)"),
+    form_id: Optional[UUID] = Query(None),
+    phone: Optional[str] = Query(None),
+    email: Optional[str] = Query(None),
+    created_after: Optional[datetime] = Query(None, description="Created at or after (inclusive)"),
+    created_before: Optional[datetime] = Query(None, description="Created before (exclusive)")
+):
+    """Get leads from database (full list, one keyset page, or an NDJSON stream)"""
+    select, filters = parse_list_query(
+        fields, LEAD_COLUMNS, form_id=form_id,
+        phone=phone, email=email, created_after=created_after, created_before=created_before
+    )
+    return await list_with_pagination(
+        response,
+        partial(get_leads_page, select=select, filters=filters),
+        partial(get_all_leads, select, filters),
+        limit, cursor, stream, raw=bool(select)
+    )
+
+
+@app.get("/leads/count")
+async def count_leads(
+    mode: Literal["exact", "planned", "estimated"] = Query("exact", description="PostgREST count strategy"),
+    form_id: Optional[UUID] = Query(None),
+    phone: Optional[str] = Query(None),
+    email: Optional[str] = Query(None),
+    created_after: Optional[datetime] = Query(None, description="Created at or after (inclusive)"),
+    created_before: Optional[datetime] = Query(None, description="Created before (exclusive)")
+):
+    """Count leads (optionally filtered); planned/estimated avoid a full count on large tables"""
+    _, filters = parse_list_query(
+        None, LEAD_COLUMNS, form_id=form_id,
+        phone=phone, email=email, created_after=created_after, created_before=created_before
+    )
+    return await count_or_502("leads", filters, mode)
 
 
 @app.post("/leads", status_code=201, response_model=LeadResponse)
@@ -294,51 +542,48 @@ async def create_new_lead(lead_data: LeadCreate):
             raise HTTPException(status_code=500, detail=f"Error creating lead: {error_message}")
 
 
+# Lead columns the send paths need (skips the responses JSONB)
+SEND_LEAD_FIELDS = "id,phone"
+
+
+def start_send_job(kind: str, recipients: List[dict], text: str, metadata: Optional[dict] = None) -> JSONResponse:
+    """Queue a background send campaign and answer 202 with its job id"""
+    job = CampaignJob(kind, len(recipients), metadata)
+    start_job(job, lambda job: send_text_messages(recipients, text, job=job))
+    return JSONResponse(
+        status_code=202,
+        content={
+            "success": True,
+            "message": "Messaging job queued",
+            "job_id": job.id,
+            "status_url": f"/jobs/{job.id}",
+            "job": job.to_dict()
+        }
+    )
+
+
 @app.post("/leads/send-messages", status_code=200)
-async def send_messages_to_leads(message_request: SendLeadMessagesRequest):
-    """Send WhatsApp messages to specific leads"""
+async def send_messages_to_leads(
+    message_request: SendLeadMessagesRequest,
+    async_mode: bool = Query(False, alias="async", description="Run as a background job and return its id")
+):
+    """Send WhatsApp messages to specific leads (optionally as a background job)"""
     try:
         # Get leads data
-        leads = await get_leads_by_ids(message_request.lead_ids)
+        leads = await get_leads_by_ids(message_request.lead_ids, select=SEND_LEAD_FIELDS)
         if not leads:
             raise HTTPException(status_code=404, detail="No leads found with provided IDs")
         
-        # Extract phone numbers and normalize them
-        phone_numbers = [lead['phone'] for lead in leads]
-        normalized_numbers = [normalize_phone_number(num) for num in phone_numbers]
-        
-        # Use existing bulk messaging functionality
-        url = f"{EVOLUTION_URL}/message/sendText/{EVOLUTION_INSTANCE_NAME}"
-        headers = {
-            "Content-Type": "application/json",
-            "apikey": EVOLUTION_API_KEY
-        }
+        # Normalize phone numbers and send through the shared engine
+        recipients = [
+            {"lead_id": str(lead['id']), "number": normalize_phone_number(lead['phone'])}
+            for lead in leads
+        ]
         
-        successful = []
-        failed = []
+        if async_mode:
+            return start_send_job("lead_messages", recipients, message_request.text)
         
-        async with httpx.AsyncClient() as client:
-            for i, number in enumerate(normalized_numbers):
-                try:
-                    payload = {
-                        "number": number,
-                        "text": message_request.text
-                    }
-                    
-                    response = await client.post(url, json=payload, headers=headers)
-                    response.raise_for_status()
-                    
-                    successful.append({
-                        "lead_id": str(message_request.lead_ids[i]),
-                        "number": number,
-                        "status": "sent"
-                    })
-                except Exception as e:
-                    failed.append({
-                        "lead_id": str(message_request.lead_ids[i]),
-                        "number": number,
-                        "error": f"API Error: {str(e)}"
-                    })
+        successful, failed = await send_text_messages(recipients, message_request.text)
         
         return {
             "success": True,
@@ -361,8 +606,21 @@ async def send_messages_to_leads(message_request: SendLeadMessagesRequest):
 
 
 @app.post("/forms/{form_id}/send-messages", status_code=200)
-async def send_messages_to_form_leads(form_id: UUID, message_request: SendFormLeadMessagesRequest):
-    """Send WhatsApp messages to all leads of a specific form"""
+async def send_messages_to_form_leads(
+    form_id: UUID,
+    message_request: SendFormLeadMessagesRequest,
+    async_mode: bool = Query(False, alias="async", description="Run as a background job and return its id"),
+    outbox: bool = Query(False, description="Queue the campaign in the durable outbox for the send workers")
+):
+    """
+    Send WhatsApp messages to all leads of a specific form
+    
+    - default: send now and return the per-lead results
+    - async=true: send in an in-process background job
+    - outbox=true: queue one outbox row per lead; run_outbox_worker.py processes them
+      and the campaign survives restarts. Pass campaign_id to make the request
+      idempotent: a retry after a failed enqueue only adds the missing rows.
+    """
     try:
         # Check if form exists
         form = await get_form_by_id(form_id)
@@ -370,46 +628,46 @@ async def send_messages_to_form_leads(form_id: UUID, message_request: SendFormLe
             raise HTTPException(status_code=404, detail="Form not found")
         
         # Get all leads for the form
-        leads = await get_leads_by_form_id(form_id)
+        leads = await get_leads_by_form_id(form_id, select=SEND_LEAD_FIELDS)
         if not leads:
             raise HTTPException(status_code=404, detail="No leads found for this form")
         
-        # Extract phone numbers and normalize them
-        phone_numbers = [lead['phone'] for lead in leads]
-        normalized_numbers = [normalize_phone_number(num) for num in phone_numbers]
+        if outbox:
+            campaign_id = message_request.campaign_id or uuid4()
+            try:
+                campaign = await enqueue_campaign(
+                    leads, message_request.text, form_id=form_id, campaign_id=campaign_id
+                )
+            except Exception as e:
+                # Chunks enqueued before the failure will be sent: retry with this id
+                raise HTTPException(status_code=500, detail={
+                    "message": f"Error queueing campaign: {str(e)}",
+                    "campaign_id": str(campaign_id),
+                    "status_url": f"/outbox/campaigns/{campaign_id}"
+                })
+            return JSONResponse(
+                status_code=202,
+                content={
+                    "success": True,
+                    "message": "Campaign queued in the outbox",
+                    **campaign,
+                    "status_url": f"/outbox/campaigns/{campaign['campaign_id']}"
+                }
+            )
         
-        # Use existing bulk messaging functionality
-        url = f"{EVOLUTION_URL}/message/sendText/{EVOLUTION_INSTANCE_NAME}"
-        headers = {
-            "Content-Type": "application/json",
-            "apikey": EVOLUTION_API_KEY
-        }
+        # Normalize phone numbers and send through the shared engine
+        recipients = [
+            {"lead_id": str(lead['id']), "number": normalize_phone_number(lead['phone'])}
+            for lead in leads
+        ]
         
-        successful = []
-        failed = []
+        if async_mode:
+            return start_send_job(
+                "form_messages", recipients, message_request.text,
+                {"form_info": {"form_id": str(form_id), "form_title": form['title']}}
+            )
         
-        async with httpx.AsyncClient() as client:
-            for i, number in enumerate(normalized_numbers):
-                try:
-                    payload = {
-                        "number": number,
-                        "text": message_request.text
-                    }
-                    
-                    response = await client.post(url, json=payload, headers=headers)
-                    response.raise_for_status()
-                    
-                    successful.append({
-                        "lead_id": str(leads[i]['id']),
-                        "number": number,
-                        "status": "sent"
-                    })
-                except Exception as e:
-                    failed.append({
-                        "lead_id": str(leads[i]['id']),
-                        "number": number,
-                        "error": f"API Error: {str(e)}"
-                    })
+        successful, failed = await send_text_messages(recipients, message_request.text)
         
         return {
             "success": True,
@@ -440,97 +698,59 @@ async def send_message(message_request: SendTextMessageRequest):
     """Send WhatsApp text message to a single number"""
     
     try:
-        url = f"{EVOLUTION_URL}/message/sendText/{EVOLUTION_INSTANCE_NAME}"
-        
-        headers = {
-            "apikey": EVOLUTION_API_KEY,
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "number": message_request.number,
-            "text": message_request.text
-        }
+        response = await send_text_message(message_request.number, message_request.text)
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers, json=payload)
-            
-            if response.status_code in [200, 201]:
-                response_data = response.json()
-                return {
-                    "success": True,
-                    "message": "Message sent successfully",
-                    "data": {
-                        "message_id": response_data.get("key", {}).get("id"),
-                        "status": response_data.get("status"),
-                        "timestamp": response_data.get("messageTimestamp")
-                    }
+        if response.status_code in [200, 201]:
+            response_data = response.json()
+            return {
+                "success": True,
+                "message": "Message sent successfully",
+                "data": {
+                    "message_id": response_data.get("key", {}).get("id"),
+                    "status": response_data.get("status"),
+                    "timestamp": response_data.get("messageTimestamp")
                 }
-            else:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Evolution API error: {response.text}"
-                )
-                
+            }
+        else:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Evolution API error: {response.text}"
+            )
+            
+    except HTTPException:
+        raise  # Re-raise HTTP exceptions as-is
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Evolution API unavailable: {str(e)}",
+            headers={"Retry-After": str(max(int(e.retry_in), 1))}
+        )
     except httpx.RequestError as e:
         raise HTTPException(status_code=500, detail=f"Network error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error sending message: {str(e)}")
 
-def normalize_phone_number(number: str) -> str:
-    """
-    Normalize phone number to include country code.
-    Rules:
-    - Remove any non-digit characters
-    - If number starts with 55, keep as is
-    - If number starts with 27 (ES DDD), add 55
-    - If number doesn't start with 55 or 27, add 55
-    """
-    # Remove non-digit characters
-    number = ''.join(filter(str.isdigit, number))
-    
-    if number.startswith('55'):
-        return number
-    elif number.startswith('27'):
-        return f'55{number}'
-    else:
-        return f'55{number}'
+@app.get("/messages/circuits")
+async def get_messaging_circuits():
+    """Circuit breaker state of each Evolution instance"""
+    return get_circuit_states()
 
 @app.post("/messages/send-bulk", status_code=200)
-async def send_bulk_messages(bulk_request: SendBulkTextMessageRequest):
+async def send_bulk_messages(
+    bulk_request: SendBulkTextMessageRequest,
+    async_mode: bool = Query(False, alias="async", description="Run as a background job and return its id")
+):
+    """Send WhatsApp text message to many numbers (optionally as a background job)"""
     try:
         # Normalize all phone numbers
         normalized_numbers = [normalize_phone_number(num) for num in bulk_request.numbers]
         
-        url = f"{EVOLUTION_URL}/message/sendText/{EVOLUTION_INSTANCE_NAME}"
-        headers = {
-            "Content-Type": "application/json",
-            "apikey": EVOLUTION_API_KEY
-        }
+        recipients = [{"number": number} for number in normalized_numbers]
         
-        successful = []
-        failed = []
+        if async_mode:
+            return start_send_job("bulk_messages", recipients, bulk_request.text)
         
-        async with httpx.AsyncClient() as client:
-            for number in normalized_numbers:
-                try:
-                    payload = {
-                        "number": number,
-                        "text": bulk_request.text
-                    }
-                    
-                    response = await client.post(url, json=payload, headers=headers)
-                    response.raise_for_status()
-                    
-                    successful.append({
-                        "number": number,
-                        "status": "sent"
-                    })
-                except Exception as e:
-                    failed.append({
-                        "number": number,
-                        "error": f"API Error: {str(e)}"
-                    })
+        successful, failed = await send_text_messages(recipients, bulk_request.text)
         
         return {
             "success": True,
@@ -546,4 +766,114 @@ async def send_bulk_messages(bulk_request: SendBulkTextMessageRequest):
             }
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error sending message: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error sending message: {str(e)}") 
+
+
+@app.get("/outbox/campaigns/{campaign_id}")
+async def get_outbox_campaign(campaign_id: UUID):
+    """Get per-status message counts of an outbox campaign"""
+    status = await get_campaign_status(campaign_id)
+    if not any(status["counts"].values()):
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return status
+
+
+# ========================
+# STATISTICS ENDPOINTS
+# ========================
+# Aggregates computed by database views, so dashboards can poll them without
+# downloading lead rows
+
+@app.get("/stats/forms")
+async def get_forms_stats(form_id: Optional[UUID] = Query(None)):
+    """Forms with their lead count (forms_with_lead_counts view)"""
+    try:
+        return await get_forms_with_lead_counts(form_id)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error fetching form statistics: {str(e)}")
+
+
+@app.get("/stats/forms/{form_id}/daily")
+async def get_form_daily_stats(
+    form_id: UUID,
+    since: Optional[date] = Query(None, description="First day (inclusive, UTC)"),
+    until: Optional[date] = Query(None, description="Last day (inclusive, UTC)")
+):
+    """Leads per day of one form; days without leads are omitted"""
+    if since and until and since > until:
+        raise HTTPException(status_code=400, detail="since must not be after until")
+    if not await get_form_by_id(form_id):
+        raise HTTPException(status_code=404, detail="Form not found")
+    try:
+        days = await get_form_daily_lead_volume(
+            form_id, since.isoformat() if since else None, until.isoformat() if until else None
+        )
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error fetching daily lead volume: {str(e)}")
+    return {
+        "form_id": str(form_id),
+        "total": sum(day["lead_count"] for day in days),
+        "days": days
+    }
+
+
+@app.get("/stats/recent-leads")
+async def get_recent_leads_stats(
+    limit: int = Query(20, ge=1, le=RECENT_LEADS_MAX),
+    form_id: Optional[UUID] = Query(None)
+):
+    """Newest leads with their form title (recent_leads_activity view)"""
+    try:
+        return await get_recent_leads_activity(limit, form_id)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error fetching recent leads: {str(e)}")
+
+
+# ========================
+# JOBS ENDPOINTS
+# ========================
+
+def _get_job_or_404(job_id: str) -> CampaignJob:
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/jobs")
+async def get_jobs():
+    """List background messaging jobs, newest first"""
+    return [job.to_dict() for job in list_jobs()]
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, include_results: bool = Query(False, description="Include per-recipient results")):
+    """Get live progress of a background messaging job"""
+    return _get_job_or_404(job_id).to_dict(include_results=include_results)
+
+
+@app.post("/jobs/{job_id}/pause")
+async def pause_job(job_id: str):
+    """Pause a queued or running job"""
+    job = _get_job_or_404(job_id)
+    if not job.pause():
+        raise HTTPException(status_code=409, detail=f"Job cannot be paused while {job.status}")
+    return job.to_dict()
+
+
+@app.post("/jobs/{job_id}/resume")
+async def resume_job(job_id: str):
+    """Resume a paused job"""
+    job = _get_job_or_404(job_id)
+    if not job.resume():
+        raise HTTPException(status_code=409, detail=f"Job cannot be resumed while {job.status}")
+    return job.to_dict()
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a job; messages already in flight still complete"""
+    job = _get_job_or_404(job_id)
+    if not job.cancel():
+        raise HTTPException(status_code=409, detail=f"Job cannot be cancelled while {job.status}")
+    return job.to_dict()
@@ -0,0 +1,319 @@
+import os
+import asyncio
+import httpx
+from dotenv import load_dotenv
+from typing import List, Optional, Dict, Any, Tuple, Callable, Awaitable, TYPE_CHECKING
+
+from app.rate_limit import TokenBucket, ConsistentHashRing
+from app.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, parse_retry_after
+
+if TYPE_CHECKING:
+    from app.jobs import CampaignJob
+
+# Load environment variables
+load_dotenv()
+
+# Evolution API Configuration
+EVOLUTION_URL = os.getenv("EVOLUTION_URL", "https://evolution-victor.namastex.ai")
+EVOLUTION_INSTANCE_NAME = os.getenv("EVOLUTION_INSTANCE_NAME", "CDLVilaVelha")
+EVOLUTION_API_KEY = os.getenv("EVOLUTION_API_KEY")
+
+# Comma separated list of instances to spread sends across (defaults to the single instance)
+EVOLUTION_INSTANCE_NAMES = [
+    name.strip()
+    for name in (os.getenv("EVOLUTION_INSTANCE_NAMES") or EVOLUTION_INSTANCE_NAME).split(",")
+    if name.strip()
+]
+
+# Per-instance send rate (messages per second, 0 disables) and burst size, for all
+# processes together. Token buckets are per process, so each sending process
+# (API and every outbox worker) enforces 1/EVOLUTION_SENDER_PROCESSES of them.
+EVOLUTION_RATE_PER_SECOND = float(os.getenv("EVOLUTION_RATE_PER_SECOND", "5"))
+EVOLUTION_RATE_BURST = float(os.getenv("EVOLUTION_RATE_BURST", "5"))
+EVOLUTION_SENDER_PROCESSES = max(int(os.getenv("EVOLUTION_SENDER_PROCESSES", "1")), 1)
+
+# Send engine settings
+# Retries for sends that provably never reached Evolution (see send_text_message)
+EVOLUTION_MAX_ATTEMPTS = int(os.getenv("EVOLUTION_MAX_ATTEMPTS", "3"))
+EVOLUTION_RETRY_BASE_DELAY = float(os.getenv("EVOLUTION_RETRY_BASE_DELAY", "0.5"))
+EVOLUTION_RETRY_MAX_DELAY = float(os.getenv("EVOLUTION_RETRY_MAX_DELAY", "30"))
+
+# Per-instance circuit breaker
+EVOLUTION_BREAKER_FAILURE_THRESHOLD = int(os.getenv("EVOLUTION_BREAKER_FAILURE_THRESHOLD", "5"))
+EVOLUTION_BREAKER_RESET_TIMEOUT = float(os.getenv("EVOLUTION_BREAKER_RESET_TIMEOUT", "30"))
+
+# sendText is not idempotent: a send is only retried when the message cannot have
+# been delivered. Connection setup failures never reached Evolution, a 429 is never
+# processed, and a 503 with Retry-After is an explicit "come back later".
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# Responses counted as failures by the circuit breaker
+FAILURE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Concurrent sends per instance
+EVOLUTION_SEND_CONCURRENCY = int(os.getenv("EVOLUTION_SEND_CONCURRENCY", "10"))
+EVOLUTION_MAX_CONNECTIONS = int(os.getenv("EVOLUTION_MAX_CONNECTIONS", "20"))
+EVOLUTION_TIMEOUT = float(os.getenv("EVOLUTION_TIMEOUT", "15"))
+
+# Shared client, created by the FastAPI lifespan (or lazily on first use)
+_evolution_client: Optional[httpx.AsyncClient] = None
+
+# Recipients are pinned to an instance by hashing their normalized phone
+_instance_ring = ConsistentHashRing(EVOLUTION_INSTANCE_NAMES)
+
+# One token bucket and one circuit breaker per instance, created on first use
+_rate_limiters: Dict[str, TokenBucket] = {}
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+
+_retry_policy = RetryPolicy(EVOLUTION_MAX_ATTEMPTS, EVOLUTION_RETRY_BASE_DELAY, EVOLUTION_RETRY_MAX_DELAY)
+
+
+def _build_evolution_client() -> httpx.AsyncClient:
+    """Create the pooled client used for every Evolution API call"""
+    return httpx.AsyncClient(
+        base_url=EVOLUTION_URL,
+        headers={
+            "Content-Type": "application/json",
+            "apikey": EVOLUTION_API_KEY or ""
+        },
+        limits=httpx.Limits(
+            max_connections=EVOLUTION_MAX_CONNECTIONS,
+            max_keepalive_connections=EVOLUTION_MAX_CONNECTIONS
+        ),
+        timeout=EVOLUTION_TIMEOUT
+    )
+
+
+async def init_evolution_client():
+    """Open the shared Evolution API client (called on application startup)"""
+    global _evolution_client
+    if _evolution_client is None or _evolution_client.is_closed:
+        _evolution_client = _build_evolution_client()
+    return _evolution_client
+
+
+async def close_evolution_client():
+    """Close the shared Evolution API client (called on shutdown)"""
+    global _evolution_client
+    if _evolution_client is not None and not _evolution_client.is_closed:
+        await _evolution_client.aclose()
+    _evolution_client = None
+
+
+def get_evolution_client() -> httpx.AsyncClient:
+    """Return the shared Evolution API client, creating it if the lifespan has not run"""
+    global _evolution_client
+    if _evolution_client is None or _evolution_client.is_closed:
+        _evolution_client = _build_evolution_client()
+    return _evolution_client
+
+
+def normalize_phone_number(number: str) -> str:
+    """
+    Normalize phone number to include country code.
+    Rules:
+    - Remove any non-digit characters
+    - If number starts with 55, keep as is
+    - If number starts with 27 (ES DDD), add 55
+    - If number doesn't start with 55 or 27, add 55
+    """
+    # Remove non-digit characters
+    number = ''.join(filter(str.isdigit, number))
+
+    if number.startswith('55'):
+        return number
+    elif number.startswith('27'):
+        return f'55{number}'
+    else:
+        return f'55{number}'
+
+
+def get_instance_for_number(number: str) -> str:
+    """Return the Evolution instance that sends to this number"""
+    return _instance_ring.get_node(normalize_phone_number(number))
+
+
+def get_rate_limiter(instance: str) -> TokenBucket:
+    """Return the token bucket limiting this process's sends through an instance"""
+    if instance not in _rate_limiters:
+        _rate_limiters[instance] = TokenBucket(
+            EVOLUTION_RATE_PER_SECOND / EVOLUTION_SENDER_PROCESSES,
+            EVOLUTION_RATE_BURST / EVOLUTION_SENDER_PROCESSES
+        )
+    return _rate_limiters[instance]
+
+
+def get_circuit_breaker(instance: str) -> CircuitBreaker:
+    """Return the circuit breaker guarding an instance"""
+    if instance not in _circuit_breakers:
+        _circuit_breakers[instance] = CircuitBreaker(
+            f"Evolution instance {instance}",
+            EVOLUTION_BREAKER_FAILURE_THRESHOLD,
+            EVOLUTION_BREAKER_RESET_TIMEOUT
+        )
+    return _circuit_breakers[instance]
+
+
+def get_circuit_states() -> List[dict]:
+    """Current state of every instance's circuit breaker"""
+    return [get_circuit_breaker(instance).to_dict() for instance in EVOLUTION_INSTANCE_NAMES]
+
+
+async def send_text_message(number: str, text: str, instance: Optional[str] = None) -> httpx.Response:
+    """
+    Send one WhatsApp text message through the Evolution API
+
+    The instance defaults to the one the number hashes to. Every attempt waits for
+    a token from that instance's rate limiter. Only sends that cannot have been
+    delivered are retried (connection setup errors, 429, 503 with Retry-After),
+    with exponential backoff and jitter (Retry-After wins when given). Any other error response is returned and
+    any other transport error (e.g. a read timeout) raised at once, since the
+    message may already be on its way.
+
+    Raises:
+        CircuitOpenError: The instance's circuit is open, nothing was sent
+    """
+    instance = instance or get_instance_for_number(number)
+    breaker = get_circuit_breaker(instance)
+    client = get_evolution_client()
+
+    for attempt in range(1, _retry_policy.max_attempts + 1):
+        breaker.before_call()
+        await get_rate_limiter(instance).acquire()
+        try:
+            response = await client.post(
+                f"/message/sendText/{instance}",
+                json={
+                    "number": number,
+                    "text": text
+                }
+            )
+        except NOT_SENT_ERRORS as e:
+            breaker.record_failure()
+            if attempt == _retry_policy.max_attempts:
+                raise
+            delay = _retry_policy.backoff(attempt)
+            print(f"Evolution request to {instance} failed ({e}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # Delivery unknown, unexpected error or cancellation: never resend, and
+            # do not leave a half-open trial hanging
+            breaker.record_failure()
+            raise
+
+        if response.status_code not in FAILURE_STATUS_CODES:
+            breaker.record_success()
+            return response
+
+        breaker.record_failure()
+        retry_after = parse_retry_after(response.headers.get("retry-after"))
+        retryable = response.status_code == 429 or (response.status_code == 503 and retry_after is not None)
+        if not retryable or attempt == _retry_policy.max_attempts:
+            return response
+        delay = _retry_policy.backoff(attempt, retry_after)
+        print(f"Evolution returned {response.status_code} for {instance}, retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+
+def is_not_sent_error(error: Exception) -> bool:
+    """True when a failed send provably never delivered the message, so sending again is safe"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code < 500 or error.response.status_code == 503
+    return isinstance(error, NOT_SENT_ERRORS)
+
+
+async def _send_to_recipient(recipient: Dict[str, Any], text: str, instance: str,
+                             job: Optional["CampaignJob"] = None
+                             ) -> Optional[Tuple[bool, Dict[str, Any], Dict[str, Any]]]:
+    """
+    Send to one recipient and build its result entry
+
+    Returns (sent, result, delivery). delivery is internal to callers with their
+    own retries (the outbox) and never part of the public result: retryable says
+    whether sending again is safe, and an open circuit without a job fails the
+    recipient at once with not_attempted and the circuit's retry_in. A background
+    job instead waits for the circuit to allow calls again (the campaign pauses
+    itself); None is returned if the job is cancelled while waiting.
+    """
+    # Extra recipient keys (e.g. lead_id) are echoed back in the result
+    result = {key: value for key, value in recipient.items() if key != "number"}
+    result["number"] = recipient["number"]
+    while True:
+        try:
+            response = await send_text_message(recipient["number"], text, instance)
+            response.raise_for_status()
+            if job is not None:
+                job.blocked_reason = None
+            result["status"] = "sent"
+            return True, result, {}
+        except CircuitOpenError as e:
+            if job is None:
+                result["error"] = f"API Error: {str(e)}"
+                return False, result, {"retryable": True, "not_attempted": True, "retry_in": e.retry_in}
+            job.blocked_reason = str(e)
+            await asyncio.sleep(max(e.retry_in, 0.1))
+            if job.cancelled:
+                return None
+        except Exception as e:
+            result["error"] = f"API Error: {str(e)}"
+            # Callers with their own retries (the outbox) must not resend when delivery is unknown
+            return False, result, {"retryable": is_not_sent_error(e)}
+
+
+async def send_text_messages(recipients: List[Dict[str, Any]], text: str,
+                             concurrency: Optional[int] = None,
+                             job: Optional["CampaignJob"] = None,
+                             on_result: Optional[Callable[[bool, Dict[str, Any], Dict[str, Any]], Awaitable[Any]]] = None
+                             ) -> Tuple[List[dict], List[dict]]:
+    """
+    Send the same text to many recipients with bounded concurrency
+
+    Recipients are split by Evolution instance (consistent hashing on the phone).
+    Each instance gets its own pool of workers pulling from its share of the
+    recipients, so a rate-limited instance never holds up the others and total
+    throughput grows with the number of instances.
+
+    Args:
+        recipients: Dicts with a normalized "number" plus any keys to echo in the results
+        text: Message text
+        concurrency: Maximum in-flight sends per instance (defaults to EVOLUTION_SEND_CONCURRENCY)
+        job: Background job to report progress to; its pause/cancel state is honored
+        on_result: Coroutine called with (sent, result, delivery) as soon as each send
+            finishes (delivery: see _send_to_recipient)
+
+    Returns:
+        Tuple of (successful, failed) result lists, each in recipient order.
+        Recipients skipped because the job was cancelled appear in neither.
+    """
+    concurrency = max(1, concurrency or EVOLUTION_SEND_CONCURRENCY)
+    results: List[Optional[Tuple[bool, Dict[str, Any]]]] = [None] * len(recipients)
+
+    shards: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+    for index, recipient in enumerate(recipients):
+        shards.setdefault(get_instance_for_number(recipient["number"]), []).append((index, recipient))
+
+    async def worker(instance: str, pending):
+        for index, recipient in pending:
+            if job is not None:
+                await job.wait_if_paused()
+                if job.cancelled:
+                    return
+            outcome = await _send_to_recipient(recipient, text, instance, job)
+            if outcome is None:
+                return
+            sent, result, delivery = outcome
+            results[index] = (sent, result)
+            if job is not None:
+                job.record(sent, result)
+            if on_result is not None:
+                await on_result(sent, result, delivery)
+
+    workers = []
+    for instance, shard in shards.items():
+        pending = iter(shard)
+        workers.extend(worker(instance, pending) for _ in range(min(concurrency, len(shard))))
+    await asyncio.gather(*workers)
+
+    successful = [result for sent, result in filter(None, results) if sent]
+    failed = [result for sent, result in filter(None, results) if not sent]
+    return successful, failed
@@ -44,6 +44,13 @@ class FormResponse(FormBase):
     id: UUID
     google_form_id: Optional[str] = None
     google_form_url: Optional[str] = None
+    field_mapping: Optional[Dict[str, str]] = None
+    last_response_submitted_at: Optional[datetime] = None
+    last_synced_at: Optional[datetime] = None
+    last_sync_duration_seconds: Optional[float] = None
+    last_sync_fetched_count: Optional[int] = None
+    last_sync_upserted_count: Optional[int] = None
+    last_sync_error: Optional[str] = None
     created_at: datetime
     updated_at: datetime
 
@@ -51,6 +58,14 @@ class FormResponse(FormBase):
         from_attributes = True
 
 
+class FormFieldMapping(BaseModel):
+    """Exact question title to read each lead field from (None keeps the heuristics)"""
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    phone: Optional[str] = None
+    email: Optional[str] = None
+
+
 # Leads Models
 class LeadBase(BaseModel):
     first_name: str
@@ -67,6 +82,7 @@ class LeadCreate(LeadBase):
 class LeadResponse(LeadBase):
     id: UUID
     form_id: UUID
+    response_id: Optional[str] = None
     responses: Optional[Dict[str, Any]] = {}
     created_at: datetime
 
@@ -82,4 +98,7 @@ class SendLeadMessagesRequest(BaseModel):
 
 class SendFormLeadMessagesRequest(BaseModel):
     form_id: UUID
-    text: str 
\ No newline at end of file
+    text: str
+    # Outbox only: idempotency key. Retrying with the same id tops up the same
+    # campaign instead of messaging already queued leads again.
+    campaign_id: Optional[UUID] = None 
\ No newline at end of file
@@ -0,0 +1,169 @@
+import os
+import socket
+import asyncio
+from datetime import datetime, timezone
+from uuid import UUID, uuid4
+from typing import List, Optional, Dict, Any, Tuple
+
+from app.database import (
+    init_http_client, close_http_client,
+    create_outbox_messages, claim_outbox_messages, update_outbox_message, count_rows
+)
+from app.messaging import (
+    init_evolution_client, close_evolution_client,
+    normalize_phone_number, send_text_messages
+)
+from app.runner import run_until_stopped
+
+# Worker settings
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_ENQUEUE_CHUNK_SIZE = int(os.getenv("OUTBOX_ENQUEUE_CHUNK_SIZE", "500"))
+
+OUTBOX_STATUSES = ("pending", "sending", "sent", "failed")
+
+
+async def enqueue_campaign(leads: List[dict], text: str, form_id: Optional[UUID] = None,
+                           campaign_id: Optional[UUID] = None) -> Dict[str, Any]:
+    """
+    Write one outbox row per lead for a new (or existing) campaign
+
+    Args:
+        leads: Leads with id and phone
+        text: Message text
+        form_id: Form the campaign targets, if any
+        campaign_id: Reuse an id to top up a campaign; duplicates per phone are ignored
+
+    Returns:
+        Dict with campaign_id and the number of rows queued
+    """
+    campaign_id = campaign_id or uuid4()
+    rows = [
+        {
+            "campaign_id": str(campaign_id),
+            "form_id": str(form_id) if form_id else None,
+            "lead_id": str(lead['id']),
+            "phone": normalize_phone_number(lead['phone']),
+            "message_text": text
+        }
+        for lead in leads
+    ]
+
+    queued = 0
+    for start in range(0, len(rows), OUTBOX_ENQUEUE_CHUNK_SIZE):
+        created = await create_outbox_messages(rows[start:start + OUTBOX_ENQUEUE_CHUNK_SIZE])
+        queued += len(created)
+
+    return {"campaign_id": str(campaign_id), "queued": queued}
+
+
+async def get_campaign_status(campaign_id: UUID) -> Dict[str, Any]:
+    """Count a campaign's outbox rows per status"""
+    counts = await asyncio.gather(*(
+        count_rows("message_outbox", {"campaign_id": f"eq.{campaign_id}", "status": f"eq.{status}"})
+        for status in OUTBOX_STATUSES
+    ))
+    return {
+        "campaign_id": str(campaign_id),
+        "counts": dict(zip(OUTBOX_STATUSES, counts))
+    }
+
+
+async def process_outbox_batch(worker_id: str, batch_size: int = OUTBOX_BATCH_SIZE) -> Tuple[int, float]:
+    """
+    Claim one batch of outbox rows, send them and record each outcome
+
+    Each row is marked as soon as its send finishes, so after a crash only the
+    rows that were in flight are retried (once their lease expires). Rows skipped
+    because an instance's circuit is open go back to pending without spending an
+    attempt.
+
+    Returns:
+        Tuple of (rows claimed, 0 when the outbox is empty; seconds until the
+        open circuit that skipped rows allows sends again, 0 if none did)
+    """
+    messages = await claim_outbox_messages(worker_id, batch_size, OUTBOX_LEASE_SECONDS, OUTBOX_MAX_ATTEMPTS)
+    if not messages:
+        return 0, 0.0
+
+    attempts = {message['id']: message['attempts'] for message in messages}
+    blocked_for = 0.0
+
+    async def mark(sent: bool, result: Dict[str, Any], delivery: Dict[str, Any]):
+        nonlocal blocked_for
+        if sent:
+            fields = {"status": "sent", "sent_at": datetime.now(timezone.utc).isoformat(), "last_error": None}
+        elif delivery.get('not_attempted'):
+            # Nothing was sent: give back the attempt the claim counted
+            blocked_for = max(blocked_for, delivery['retry_in'], 0.1)
+            fields = {"status": "pending", "attempts": attempts[result['outbox_id']] - 1,
+                      "last_error": result.get('error')}
+        else:
+            # Failed rows go back to pending until they run out of attempts, unless
+            # the message may have been delivered (a retry could send it twice)
+            exhausted = attempts[result['outbox_id']] >= OUTBOX_MAX_ATTEMPTS
+            retry = delivery.get('retryable') and not exhausted
+            fields = {"status": "pending" if retry else "failed", "last_error": result.get('error')}
+        fields["locked_by"] = None
+        fields["locked_at"] = None
+        if not await update_outbox_message(result['outbox_id'], worker_id, fields):
+            print(f"Outbox worker {worker_id} could not record message {result['outbox_id']} "
+                  f"(lease lost or update failed)")
+
+    # Rows of one campaign share their text, so a batch usually has a single group
+    by_text: Dict[str, List[dict]] = {}
+    for message in messages:
+        by_text.setdefault(message['message_text'], []).append(
+            {"outbox_id": message['id'], "number": message['phone']}
+        )
+
+    for text, recipients in by_text.items():
+        await send_text_messages(recipients, text, on_result=mark)
+
+    print(f"Outbox worker {worker_id} processed {len(messages)} messages")
+    return len(messages), blocked_for
+
+
+async def run_outbox_worker(worker_id: Optional[str] = None, stop_event: Optional[asyncio.Event] = None):
+    """
+    Poll the outbox until stop_event is set
+
+    Run as many worker processes as needed; claims use SKIP LOCKED so workers never
+    receive the same rows.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    stop_event = stop_event or asyncio.Event()
+    print(f"Outbox worker {worker_id} started (batch size {OUTBOX_BATCH_SIZE})")
+
+    while not stop_event.is_set():
+        try:
+            claimed, blocked_for = await process_outbox_batch(worker_id)
+        except Exception as e:
+            print(f"Error in outbox worker {worker_id}: {e}")
+            claimed, blocked_for = 0, 0.0
+
+        if blocked_for > 0:
+            # A circuit is open: reclaiming now would only skip the same rows again
+            wait = blocked_for
+        elif not claimed:
+            # Nothing to do: wait for the poll interval
+            wait = OUTBOX_POLL_INTERVAL
+        else:
+            continue
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=wait)
+        except asyncio.TimeoutError:
+            pass
+
+    print(f"Outbox worker {worker_id} stopped")
+
+
+async def main():
+    """Entry point for run_outbox_worker.py"""
+    await run_until_stopped(
+        lambda stop_event: run_outbox_worker(stop_event=stop_event),
+        startup=(init_http_client, init_evolution_client),
+        shutdown=(close_evolution_client, close_http_client)
+    )
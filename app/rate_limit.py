@@ -0,0 +1,104 @@
+import time
+import asyncio
+import threading
+import bisect
+import hashlib
+from typing import Dict, List
+
+
+class TokenBucket:
+    """
+    Async token bucket
+
+    Tokens refill continuously at `rate` per second up to `capacity`. Callers wait
+    in FIFO order until a token is available. A rate of 0 or less disables limiting.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, tokens: float = 1.0):
+        """Wait until `tokens` are available and take them"""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class BlockingTokenBucket:
+    """
+    Thread-safe token bucket for code running in worker threads
+
+    Same refill rules as TokenBucket, but acquire() blocks the calling thread.
+    Requests for more tokens than the capacity are served one token at a time,
+    so large batches are charged in full instead of being capped at the burst.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self, tokens: int = 1):
+        """Block until `tokens` have been taken"""
+        if self.rate <= 0:
+            return
+        for _ in range(max(int(tokens), 1)):
+            # Holding the lock while sleeping keeps waiting threads in line
+            with self._lock:
+                while True:
+                    self._refill()
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        break
+                    time.sleep((1 - self._tokens) / self.rate)
+
+
+class ConsistentHashRing:
+    """
+    Map keys to nodes with consistent hashing
+
+    Each node gets `replicas` virtual points on the ring, so keys spread evenly and
+    adding or removing a node only moves the keys that node owned.
+    """
+
+    def __init__(self, nodes: List[str], replicas: int = 100):
+        if not nodes:
+            raise ValueError("ConsistentHashRing needs at least one node")
+        self.nodes = list(nodes)
+        points: Dict[int, str] = {}
+        for node in self.nodes:
+            for replica in range(replicas):
+                points[self._hash(f"{node}#{replica}")] = node
+        self._keys = sorted(points)
+        self._nodes = [points[key] for key in self._keys]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+    def get_node(self, key: str) -> str:
+        """Return the node owning key"""
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._nodes[index]
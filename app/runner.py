@@ -0,0 +1,35 @@
+import signal
+import asyncio
+from typing import Any, Awaitable, Callable, Sequence
+
+
+async def run_until_stopped(service: Callable[[asyncio.Event], Awaitable[Any]],
+                            startup: Sequence[Callable[[], Awaitable[Any]]] = (),
+                            shutdown: Sequence[Callable[[], Awaitable[Any]]] = ()):
+    """
+    Run a background service of a run_*.py entry point until SIGINT/SIGTERM
+
+    The startup hooks run in order before the service and the shutdown hooks
+    always run afterwards (they must tolerate resources that were never opened).
+
+    Args:
+        service: Coroutine function taking the stop event it must watch
+        startup: Hooks opening shared clients
+        shutdown: Hooks closing them, in order
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Signal handlers are not available on Windows event loops
+            pass
+
+    try:
+        for hook in startup:
+            await hook()
+        await service(stop_event)
+    finally:
+        for hook in shutdown:
+            await hook()
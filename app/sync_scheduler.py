@@ -0,0 +1,136 @@
+import os
+import time
+import asyncio
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any
+
+from app.database import init_http_client, close_http_client, get_google_linked_forms
+from app.form_sync import sync_form, sync_since
+from app.google_forms import (
+    get_google_forms_responses_batch, warm_up_google_forms_service, close_google_forms_service
+)
+from app.runner import run_until_stopped
+
+# Seconds between two passes over every Google-linked form
+FORM_SYNC_INTERVAL = float(os.getenv("FORM_SYNC_INTERVAL", "300"))
+# Forms synced at the same time (Google calls are also bounded by the API quota)
+FORM_SYNC_CONCURRENCY = int(os.getenv("FORM_SYNC_CONCURRENCY", "3"))
+# Start the scheduler inside the API process (otherwise run run_form_sync.py)
+FORM_SYNC_SCHEDULER_ENABLED = os.getenv("FORM_SYNC_SCHEDULER_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# State of the scheduler running in this process
+_scheduler_task: Optional[asyncio.Task] = None
+_scheduler_stop: Optional[asyncio.Event] = None
+_last_run: Dict[str, Any] = {}
+_run_lock: Optional[asyncio.Lock] = None
+
+
+async def sync_all_forms(concurrency: int = FORM_SYNC_CONCURRENCY) -> Dict[str, Any]:
+    """
+    Sync every form with a google_form_id, up to `concurrency` at a time
+
+    The first page of every form (and any stale structure) is fetched in batched
+    Google requests. A failing form does not stop the others; its error is
+    stored on its row by sync_form and listed in the result.
+    """
+    global _run_lock
+    if _run_lock is None:
+        _run_lock = asyncio.Lock()
+
+    # Overlapping passes (interval tick plus a manual trigger) would sync forms twice
+    async with _run_lock:
+        started_at = datetime.now(timezone.utc)
+        started = time.monotonic()
+        forms = await get_google_linked_forms()
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+        prefetched: Dict[str, Dict[str, Any]] = {}
+        if forms:
+            try:
+                prefetched = await get_google_forms_responses_batch(
+                    {form['google_form_id']: sync_since(form) for form in forms}
+                )
+            except Exception as e:
+                # Fall back to fetching each form on its own
+                print(f"Batched form fetch failed: {e}")
+
+        async def run(form):
+            async with semaphore:
+                try:
+                    result = await sync_form(form, prefetched=prefetched.get(form['google_form_id']))
+                    return {
+                        "form_id": result['form_id'],
+                        "status": "ok",
+                        "fetched_leads": result['fetched_leads'],
+                        "upserted_count": result['upserted_count'],
+                        "duration_seconds": result['duration_seconds']
+                    }
+                except Exception as e:
+                    print(f"Error syncing form {form['id']}: {e}")
+                    return {"form_id": str(form['id']), "status": "error", "error": str(e)}
+
+        results = await asyncio.gather(*(run(form) for form in forms))
+
+        _last_run.clear()
+        _last_run.update({
+            "started_at": started_at.isoformat(),
+            "duration_seconds": round(time.monotonic() - started, 3),
+            "forms": len(forms),
+            "failed_forms": sum(1 for result in results if result['status'] == "error"),
+            "upserted_count": sum(result.get('upserted_count', 0) for result in results)
+        })
+        print(f"Form sync pass: {_last_run['forms']} forms, {_last_run['upserted_count']} leads upserted "
+              f"in {_last_run['duration_seconds']}s")
+        return {**_last_run, "results": results}
+
+
+async def run_form_sync_scheduler(stop_event: asyncio.Event, interval: float = FORM_SYNC_INTERVAL):
+    """Sync every Google-linked form every `interval` seconds until stop_event is set"""
+    print(f"Form sync scheduler started (every {interval:.0f}s, {FORM_SYNC_CONCURRENCY} forms at a time)")
+    while not stop_event.is_set():
+        try:
+            await sync_all_forms()
+        except Exception as e:
+            print(f"Error in form sync scheduler: {e}")
+
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+    print("Form sync scheduler stopped")
+
+
+def start_form_sync_scheduler():
+    """Start the scheduler as a background task of the running event loop"""
+    global _scheduler_task, _scheduler_stop
+    if _scheduler_task and not _scheduler_task.done():
+        return
+    _scheduler_stop = asyncio.Event()
+    _scheduler_task = asyncio.create_task(run_form_sync_scheduler(_scheduler_stop))
+
+
+async def stop_form_sync_scheduler():
+    """Stop the scheduler; an interrupted pass is simply redone next time (syncs are idempotent)"""
+    if not _scheduler_task:
+        return
+    _scheduler_stop.set()
+    _scheduler_task.cancel()
+    await asyncio.gather(_scheduler_task, return_exceptions=True)
+
+
+def get_scheduler_status() -> Dict[str, Any]:
+    return {
+        "running": bool(_scheduler_task and not _scheduler_task.done()),
+        "interval_seconds": FORM_SYNC_INTERVAL,
+        "concurrency": FORM_SYNC_CONCURRENCY,
+        "last_run": _last_run or None
+    }
+
+
+async def main():
+    """Entry point for run_form_sync.py"""
+    await run_until_stopped(
+        run_form_sync_scheduler,
+        startup=(init_http_client, warm_up_google_forms_service),
+        shutdown=(close_google_forms_service, close_http_client)
+    )
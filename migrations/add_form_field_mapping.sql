@@ -0,0 +1,21 @@
+-- CDL Jovem Vila Velha API - Database Migration
+-- Per-form overrides of the question -> lead field mapping used by the sync
+-- Requires create_forms_and_leads_tables.sql (forms)
+
+-- ==============================================
+-- FORMS: FIELD MAPPING OVERRIDES
+-- ==============================================
+-- Lead field -> exact Google Form question title, e.g.
+--   {"phone": "Seu celular com DDD", "first_name": "Como podemos te chamar?"}
+-- Fields left out keep the keyword heuristics.
+ALTER TABLE forms ADD COLUMN IF NOT EXISTS field_mapping JSONB DEFAULT '{}';
+
+-- ==============================================
+-- MIGRATION COMPLETION MESSAGE
+-- ==============================================
+DO $$
+BEGIN
+    RAISE NOTICE 'CDL Jovem Vila Velha API - Form field mapping column added successfully!';
+    RAISE NOTICE 'Column added: forms.field_mapping';
+    RAISE NOTICE 'Migration completed at: %', NOW();
+END $$;
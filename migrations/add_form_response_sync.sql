@@ -0,0 +1,32 @@
+-- CDL Jovem Vila Velha API - Database Migration
+-- Columns used by the Google Forms -> leads sync pipeline
+-- Requires create_forms_and_leads_tables.sql (forms, leads)
+
+-- ==============================================
+-- LEADS: GOOGLE RESPONSE ID
+-- ==============================================
+-- Leads synced from Google Forms keep the response they came from, so re-running
+-- a sync upserts (on_conflict=response_id) instead of inserting duplicates.
+-- Leads created by hand or by CSV import leave it NULL.
+ALTER TABLE leads ADD COLUMN IF NOT EXISTS response_id VARCHAR(255);
+
+-- A full (non-partial) unique index is required for PostgREST on_conflict
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leads_response_id ON leads(response_id);
+
+-- ==============================================
+-- FORMS: SYNC WATERMARK
+-- ==============================================
+-- Newest lastSubmittedTime written to leads; the next sync only asks Google
+-- for responses submitted at or after it.
+ALTER TABLE forms ADD COLUMN IF NOT EXISTS last_response_submitted_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE forms ADD COLUMN IF NOT EXISTS last_synced_at TIMESTAMP WITH TIME ZONE;
+
+-- ==============================================
+-- MIGRATION COMPLETION MESSAGE
+-- ==============================================
+DO $$
+BEGIN
+    RAISE NOTICE 'CDL Jovem Vila Velha API - Form response sync columns added successfully!';
+    RAISE NOTICE 'Columns added: leads.response_id, forms.last_response_submitted_at, forms.last_synced_at';
+    RAISE NOTICE 'Migration completed at: %', NOW();
+END $$;
@@ -0,0 +1,23 @@
+-- CDL Jovem Vila Velha API - Database Migration
+-- Per-form statistics of the last Google Forms sync
+-- Requires add_form_response_sync.sql (forms.last_synced_at)
+
+-- ==============================================
+-- FORMS: LAST SYNC STATISTICS
+-- ==============================================
+-- Written by every sync (manual or scheduled), so the API can report them
+-- even when the scheduler runs in a separate process.
+ALTER TABLE forms ADD COLUMN IF NOT EXISTS last_sync_duration_seconds REAL;
+ALTER TABLE forms ADD COLUMN IF NOT EXISTS last_sync_fetched_count INTEGER;
+ALTER TABLE forms ADD COLUMN IF NOT EXISTS last_sync_upserted_count INTEGER;
+ALTER TABLE forms ADD COLUMN IF NOT EXISTS last_sync_error TEXT;
+
+-- ==============================================
+-- MIGRATION COMPLETION MESSAGE
+-- ==============================================
+DO $$
+BEGIN
+    RAISE NOTICE 'CDL Jovem Vila Velha API - Form sync statistics columns added successfully!';
+    RAISE NOTICE 'Columns added: forms.last_sync_duration_seconds, last_sync_fetched_count, last_sync_upserted_count, last_sync_error';
+    RAISE NOTICE 'Migration completed at: %', NOW();
+END $$;
@@ -0,0 +1,201 @@
+-- CDL Jovem Vila Velha API - Database Migration
+-- Lead counters kept up to date by triggers, so lead statistics are read in
+-- constant time instead of grouping the whole leads table on every request
+-- Requires create_lead_volume_views.sql (form_daily_lead_volume)
+
+-- ==============================================
+-- SUMMARY TABLES
+-- ==============================================
+-- Leads per form
+CREATE TABLE IF NOT EXISTS form_lead_stats (
+    form_id UUID PRIMARY KEY REFERENCES forms(id) ON DELETE CASCADE,
+    lead_count BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Leads per form and UTC day (rows are removed when a day drops to zero)
+CREATE TABLE IF NOT EXISTS form_daily_lead_stats (
+    form_id UUID NOT NULL REFERENCES forms(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    lead_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (form_id, day)
+);
+
+-- ==============================================
+-- INCREMENTAL MAINTENANCE
+-- ==============================================
+-- Add p_delta leads to a form and day. Forms deleted in the same transaction
+-- (leads removed by ON DELETE CASCADE) are skipped; their rows cascade away.
+CREATE OR REPLACE FUNCTION apply_lead_stats_delta(p_form_id UUID, p_day DATE, p_delta BIGINT)
+RETURNS VOID AS $$
+BEGIN
+    IF p_form_id IS NULL OR p_delta = 0 OR NOT EXISTS (SELECT 1 FROM forms WHERE id = p_form_id) THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO form_lead_stats (form_id, lead_count, updated_at)
+    VALUES (p_form_id, p_delta, NOW())
+    ON CONFLICT (form_id) DO UPDATE
+    SET lead_count = form_lead_stats.lead_count + EXCLUDED.lead_count,
+        updated_at = NOW();
+
+    INSERT INTO form_daily_lead_stats (form_id, day, lead_count)
+    VALUES (p_form_id, p_day, p_delta)
+    ON CONFLICT (form_id, day) DO UPDATE
+    SET lead_count = form_daily_lead_stats.lead_count + EXCLUDED.lead_count;
+
+    DELETE FROM form_daily_lead_stats
+    WHERE form_id = p_form_id AND day = p_day AND lead_count <= 0;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level triggers see every row of a statement at once, so a batch
+-- insert of 500 leads touches each (form, day) counter once, not 500 times.
+-- Updates that keep form_id and the day (e.g. re-synced responses) cancel out.
+CREATE OR REPLACE FUNCTION update_lead_stats()
+RETURNS TRIGGER AS $$
+DECLARE
+    r RECORD;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        FOR r IN
+            SELECT form_id, (created_at AT TIME ZONE 'UTC')::date AS day, COUNT(*) AS delta
+            FROM new_leads
+            GROUP BY 1, 2
+        LOOP
+            PERFORM apply_lead_stats_delta(r.form_id, r.day, r.delta);
+        END LOOP;
+    ELSIF TG_OP = 'DELETE' THEN
+        FOR r IN
+            SELECT form_id, (created_at AT TIME ZONE 'UTC')::date AS day, -COUNT(*) AS delta
+            FROM old_leads
+            GROUP BY 1, 2
+        LOOP
+            PERFORM apply_lead_stats_delta(r.form_id, r.day, r.delta);
+        END LOOP;
+    ELSIF TG_OP = 'UPDATE' THEN
+        FOR r IN
+            SELECT form_id, day, SUM(delta) AS delta
+            FROM (
+                SELECT form_id, (created_at AT TIME ZONE 'UTC')::date AS day, 1 AS delta FROM new_leads
+                UNION ALL
+                SELECT form_id, (created_at AT TIME ZONE 'UTC')::date AS day, -1 AS delta FROM old_leads
+            ) changes
+            GROUP BY 1, 2
+            HAVING SUM(delta) <> 0
+        LOOP
+            PERFORM apply_lead_stats_delta(r.form_id, r.day, r.delta);
+        END LOOP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS update_lead_stats_on_insert ON leads;
+CREATE TRIGGER update_lead_stats_on_insert
+    AFTER INSERT ON leads
+    REFERENCING NEW TABLE AS new_leads
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION update_lead_stats();
+
+DROP TRIGGER IF EXISTS update_lead_stats_on_update ON leads;
+CREATE TRIGGER update_lead_stats_on_update
+    AFTER UPDATE ON leads
+    REFERENCING OLD TABLE AS old_leads NEW TABLE AS new_leads
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION update_lead_stats();
+
+DROP TRIGGER IF EXISTS update_lead_stats_on_delete ON leads;
+CREATE TRIGGER update_lead_stats_on_delete
+    AFTER DELETE ON leads
+    REFERENCING OLD TABLE AS old_leads
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION update_lead_stats();
+
+CREATE OR REPLACE FUNCTION clear_lead_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    DELETE FROM form_daily_lead_stats;
+    DELETE FROM form_lead_stats;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS clear_lead_stats_on_truncate ON leads;
+CREATE TRIGGER clear_lead_stats_on_truncate
+    AFTER TRUNCATE ON leads
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION clear_lead_stats();
+
+-- ==============================================
+-- FULL REFRESH
+-- ==============================================
+-- Recount from leads (called through PostgREST as /rpc/refresh_lead_stats, or
+-- by `python run_migration.py --refresh-lead-stats`). Only needed to backfill
+-- or to repair drift, e.g. after triggers were disabled for a bulk load.
+-- p_form_id limits the recount to one form. Lead writes wait while it runs.
+CREATE OR REPLACE FUNCTION refresh_lead_stats(p_form_id UUID DEFAULT NULL)
+RETURNS TABLE (forms_counted BIGINT, days_counted BIGINT) AS $$
+BEGIN
+    LOCK TABLE leads IN SHARE MODE;
+
+    DELETE FROM form_daily_lead_stats s WHERE p_form_id IS NULL OR s.form_id = p_form_id;
+    DELETE FROM form_lead_stats s WHERE p_form_id IS NULL OR s.form_id = p_form_id;
+
+    INSERT INTO form_daily_lead_stats (form_id, day, lead_count)
+    SELECT l.form_id, (l.created_at AT TIME ZONE 'UTC')::date, COUNT(*)
+    FROM leads l
+    JOIN forms f ON f.id = l.form_id
+    WHERE p_form_id IS NULL OR l.form_id = p_form_id
+    GROUP BY 1, 2;
+
+    INSERT INTO form_lead_stats (form_id, lead_count, updated_at)
+    SELECT d.form_id, SUM(d.lead_count), NOW()
+    FROM form_daily_lead_stats d
+    WHERE p_form_id IS NULL OR d.form_id = p_form_id
+    GROUP BY 1;
+
+    RETURN QUERY
+    SELECT
+        (SELECT COUNT(*) FROM form_lead_stats s WHERE p_form_id IS NULL OR s.form_id = p_form_id),
+        (SELECT COUNT(*) FROM form_daily_lead_stats s WHERE p_form_id IS NULL OR s.form_id = p_form_id);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Backfill the counters for the leads that already exist
+SELECT * FROM refresh_lead_stats();
+
+-- ==============================================
+-- VIEWS READ FROM THE COUNTERS
+-- ==============================================
+-- Same columns as before, so the API and any dashboards keep working unchanged
+CREATE OR REPLACE VIEW forms_with_lead_counts AS
+SELECT
+    f.id,
+    f.title,
+    f.description,
+    f.google_form_id,
+    f.google_form_url,
+    f.created_at,
+    f.updated_at,
+    COALESCE(s.lead_count, 0) as lead_count
+FROM forms f
+LEFT JOIN form_lead_stats s ON f.id = s.form_id;
+
+CREATE OR REPLACE VIEW form_daily_lead_volume AS
+SELECT
+    d.form_id,
+    d.day,
+    d.lead_count
+FROM form_daily_lead_stats d;
+
+-- ==============================================
+-- MIGRATION COMPLETION MESSAGE
+-- ==============================================
+DO $$
+BEGIN
+    RAISE NOTICE 'CDL Jovem Vila Velha API - Lead statistics tables created successfully!';
+    RAISE NOTICE 'Tables created: form_lead_stats, form_daily_lead_stats';
+    RAISE NOTICE 'Functions created: apply_lead_stats_delta, update_lead_stats, clear_lead_stats, refresh_lead_stats';
+    RAISE NOTICE 'Migration completed at: %', NOW();
+END $$;
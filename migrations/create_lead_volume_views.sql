@@ -0,0 +1,34 @@
+-- CDL Jovem Vila Velha API - Database Migration
+-- Aggregates read by the dashboard statistics endpoints
+-- Requires create_forms_and_leads_tables.sql (forms, leads)
+
+-- ==============================================
+-- LEADS: FORM + DAY INDEX
+-- ==============================================
+-- Serves the per-form daily volume (and created_at range filters on one form)
+-- from the index instead of scanning every lead of the form.
+CREATE INDEX IF NOT EXISTS idx_leads_form_id_created_at ON leads(form_id, created_at);
+
+-- ==============================================
+-- DAILY LEAD VOLUME PER FORM
+-- ==============================================
+-- One row per form and (UTC) day with at least one lead. Filter it through
+-- PostgREST, e.g. ?form_id=eq.<id>&day=gte.2024-01-01
+CREATE OR REPLACE VIEW form_daily_lead_volume AS
+SELECT
+    l.form_id,
+    (l.created_at AT TIME ZONE 'UTC')::date AS day,
+    COUNT(*) AS lead_count
+FROM leads l
+WHERE l.form_id IS NOT NULL
+GROUP BY l.form_id, (l.created_at AT TIME ZONE 'UTC')::date;
+
+-- ==============================================
+-- MIGRATION COMPLETION MESSAGE
+-- ==============================================
+DO $$
+BEGIN
+    RAISE NOTICE 'CDL Jovem Vila Velha API - Lead volume views created successfully!';
+    RAISE NOTICE 'Created: form_daily_lead_volume view, idx_leads_form_id_created_at index';
+    RAISE NOTICE 'Migration completed at: %', NOW();
+END $$;
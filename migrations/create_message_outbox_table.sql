@@ -0,0 +1,98 @@
+-- CDL Jovem Vila Velha API - Database Migration
+-- Create the message outbox used by the resumable WhatsApp send worker
+-- Requires create_forms_and_leads_tables.sql (forms, leads, update_updated_at_column)
+
+-- ==============================================
+-- MESSAGE OUTBOX TABLE
+-- ==============================================
+-- One row per message to send. Workers claim pending rows in batches, send them
+-- and record the outcome, so a campaign interrupted by a restart resumes from
+-- the rows that are still pending.
+CREATE TABLE IF NOT EXISTS message_outbox (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    campaign_id UUID NOT NULL,
+    form_id UUID REFERENCES forms(id) ON DELETE SET NULL,
+    lead_id UUID REFERENCES leads(id) ON DELETE CASCADE,
+    phone VARCHAR(20) NOT NULL,
+    message_text TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending'
+        CHECK (status IN ('pending', 'sending', 'sent', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    locked_by VARCHAR(255),
+    locked_at TIMESTAMP WITH TIME ZONE,
+    sent_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    -- A phone is messaged at most once per campaign, even if enqueued twice
+    CONSTRAINT message_outbox_campaign_phone_key UNIQUE (campaign_id, phone)
+);
+
+-- Index used by workers to find claimable rows in creation order
+CREATE INDEX IF NOT EXISTS idx_message_outbox_claimable
+    ON message_outbox(created_at)
+    WHERE status IN ('pending', 'sending');
+CREATE INDEX IF NOT EXISTS idx_message_outbox_campaign_status ON message_outbox(campaign_id, status);
+
+-- Apply updated_at trigger to message_outbox table
+DROP TRIGGER IF EXISTS update_message_outbox_updated_at ON message_outbox;
+CREATE TRIGGER update_message_outbox_updated_at
+    BEFORE UPDATE ON message_outbox
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- ==============================================
+-- CLAIM FUNCTION
+-- ==============================================
+-- Atomically claim up to p_batch_size rows for a worker (called through
+-- PostgREST as /rpc/claim_outbox_messages). SKIP LOCKED lets any number of
+-- workers claim concurrently without receiving the same rows. Rows stuck in
+-- 'sending' longer than the lease (worker crashed mid-batch) are claimable again,
+-- or marked 'failed' when the crash happened during their last attempt.
+CREATE OR REPLACE FUNCTION claim_outbox_messages(
+    p_worker_id TEXT,
+    p_batch_size INTEGER DEFAULT 50,
+    p_lease_seconds INTEGER DEFAULT 300,
+    p_max_attempts INTEGER DEFAULT 5
+)
+RETURNS SETOF message_outbox AS $$
+BEGIN
+    -- Expired leases with no attempts left would otherwise stay 'sending' forever
+    UPDATE message_outbox
+    SET status = 'failed',
+        locked_by = NULL,
+        locked_at = NULL,
+        last_error = COALESCE(last_error, 'Worker lease expired during the last attempt')
+    WHERE status = 'sending'
+      AND locked_at < NOW() - make_interval(secs => p_lease_seconds)
+      AND attempts >= p_max_attempts;
+
+    RETURN QUERY
+    UPDATE message_outbox o
+    SET status = 'sending',
+        locked_by = p_worker_id,
+        locked_at = NOW(),
+        attempts = o.attempts + 1
+    WHERE o.id IN (
+        SELECT c.id
+        FROM message_outbox c
+        WHERE (c.status = 'pending'
+               OR (c.status = 'sending' AND c.locked_at < NOW() - make_interval(secs => p_lease_seconds)))
+          AND c.attempts < p_max_attempts
+        ORDER BY c.created_at
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING o.*;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ==============================================
+-- MIGRATION COMPLETION MESSAGE
+-- ==============================================
+DO $$
+BEGIN
+    RAISE NOTICE 'CDL Jovem Vila Velha API - message_outbox table created successfully!';
+    RAISE NOTICE 'Function created: claim_outbox_messages';
+    RAISE NOTICE 'Migration completed at: %', NOW();
+END $$;
@@ -0,0 +1,7 @@
+import asyncio
+
+from app.sync_scheduler import main
+
+if __name__ == "__main__":
+    # Sync every Google-linked form on FORM_SYNC_INTERVAL; run one scheduler process only
+    asyncio.run(main())
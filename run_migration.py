@@ -2,9 +2,13 @@
 """
 CDL Jovem Vila Velha API - Database Migration Runner
 Run this script to create the forms and leads tables in Supabase
+
+    python run_migration.py                                  # run every migration
+    python run_migration.py --refresh-lead-stats [FORM_ID]   # recount lead statistics
 """
 
 import os
+import sys
 import asyncio
 import httpx
 from dotenv import load_dotenv
@@ -12,8 +16,19 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-async def run_migration():
-    """Execute the database migration"""
+# Migration files, executed in order
+MIGRATION_FILES = [
+    "migrations/create_forms_and_leads_tables.sql",
+    "migrations/create_message_outbox_table.sql",
+    "migrations/add_form_response_sync.sql",
+    "migrations/add_form_field_mapping.sql",
+    "migrations/add_form_sync_stats.sql",
+    "migrations/create_lead_volume_views.sql",
+    "migrations/create_lead_stats_tables.sql",
+]
+
+async def run_migration(migration_file):
+    """Execute one database migration file"""
     
     # Get Supabase credentials
     SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -27,11 +42,10 @@ async def run_migration():
     print("=" * 50)
     print(f"📍 Supabase URL: {SUPABASE_URL}")
     print(f"🔑 API Key: {SUPABASE_KEY[:20]}...")
+    print(f"📄 Migration file: {migration_file}")
     print()
     
     # Read migration SQL
-    migration_file = "migrations/create_forms_and_leads_tables.sql"
-    
     try:
         with open(migration_file, 'r', encoding='utf-8') as f:
             migration_sql = f.read()
@@ -65,19 +79,7 @@ async def run_migration():
             )
             
             if response.status_code in [200, 201]:
-                print("✅ Migration executed successfully!")
-                print()
-                print("📋 Summary:")
-                print("  • Created 'forms' table with indexes and triggers")
-                print("  • Created 'leads' table with indexes and foreign keys")
-                print("  • Added validation functions for Brazilian phone numbers")
-                print("  • Created helpful views: forms_with_lead_counts, recent_leads_activity")
-                print()
-                print("🎉 Your API now supports:")
-                print("  • Google Forms integration")
-                print("  • Lead management")
-                print("  • Multi-section WhatsApp campaigns")
-                print("  • Backward compatibility with existing CSV functionality")
+                print(f"✅ Migration executed successfully: {migration_file}")
                 print()
                 return True
                 
@@ -115,7 +117,7 @@ async def run_migration():
                         print(f"  ❌ Statement {i+1} error: {str(e)}")
                 
                 if success_count > 0:
-                    print(f")
+                    print()
                     print(f"✅ Partial migration completed: {success_count} statements executed")
                     return True
                 else:
@@ -174,18 +176,90 @@ async def verify_migration():
             return False
 
 
+async def refresh_lead_stats(form_id=None):
+    """
+    Recount the lead statistics tables from leads (all forms, or one form)
+
+    Triggers keep the counters current; this backfills them or repairs drift,
+    e.g. after leads were bulk loaded with triggers disabled.
+    """
+    SUPABASE_URL = os.getenv("SUPABASE_URL")
+    SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        print("❌ Error: SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
+        return False
+
+    headers = {
+        "apikey": SUPABASE_KEY,
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "Content-Type": "application/json"
+    }
+
+    print(f"🔄 Refreshing lead statistics ({'form ' + form_id if form_id else 'all forms'})...")
+
+    async with httpx.AsyncClient(timeout=300.0) as client:
+        try:
+            response = await client.post(
+                f"{SUPABASE_URL}/rest/v1/rpc/refresh_lead_stats",
+                headers=headers,
+                json={"p_form_id": form_id}
+            )
+        except httpx.RequestError as e:
+            print(f"❌ Network error: {str(e)}")
+            return False
+
+    if response.status_code != 200:
+        print(f"❌ Refresh failed with status {response.status_code}")
+        print(f"Response: {response.text}")
+        return False
+
+    result = (response.json() or [{}])[0]
+    print(f"✅ Lead statistics refreshed: {result.get('forms_counted', 0)} forms, "
+          f"{result.get('days_counted', 0)} form days")
+    return True
+
+
 async def main():
     """Main migration process"""
     
+    if len(sys.argv) > 1 and sys.argv[1] == "--refresh-lead-stats":
+        await refresh_lead_stats(sys.argv[2] if len(sys.argv) > 2 else None)
+        return
+
     print("🎯 CDL Jovem Vila Velha API - Multi-Section WhatsApp Campaign System")
     print("   Database Migration for Forms and Leads")
     print("=" * 70)
     print()
     
-    # Run migration
-    migration_success = await run_migration()
+    # Run migrations in order, stopping at the first failure
+    migration_success = True
+    for migration_file in MIGRATION_FILES:
+        migration_success = await run_migration(migration_file)
+        if not migration_success:
+            break
     
     if migration_success:
+        print()
+        print("📋 Summary:")
+        print("  • Created 'forms' table with indexes and triggers")
+        print("  • Created 'leads' table with indexes and foreign keys")
+        print("  • Added validation functions for Brazilian phone numbers")
+        print("  • Created helpful views: forms_with_lead_counts, recent_leads_activity")
+        print("  • Created 'message_outbox' table and claim_outbox_messages function")
+        print("  • Added leads.response_id and the forms sync watermark columns")
+        print("  • Added forms.field_mapping for question -> lead field overrides")
+        print("  • Added per-form last sync statistics columns")
+        print("  • Created form_daily_lead_volume view for dashboard statistics")
+        print("  • Added trigger-maintained lead counters (form_lead_stats, form_daily_lead_stats)")
+        print()
+        print("🎉 Your API now supports:")
+        print("  • Google Forms integration")
+        print("  • Lead management")
+        print("  • Multi-section WhatsApp campaigns")
+        print("  • Backward compatibility with existing CSV functionality")
+        print()
+
         print()
         print("⏳ Waiting a moment for database to sync...")
         await asyncio.sleep(2)
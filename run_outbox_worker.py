@@ -0,0 +1,9 @@
+import asyncio
+
+from app.outbox_worker import main
+
+if __name__ == "__main__":
+    # Start one outbox worker process; run several for more throughput. The Evolution
+    # rate limit is enforced per process: set EVOLUTION_SENDER_PROCESSES to the number
+    # of sending processes (workers + API) so together they stay within it.
+    asyncio.run(main())